@@ -0,0 +1,183 @@
+"""
+调试接口 - 请求追踪、采样分析、token 统计与缓存预热（需开启 ENABLE_DEBUG_ENDPOINTS）
+"""
+
+import asyncio
+from typing import TYPE_CHECKING
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.api.deps import get_services
+from app.core.profiler import profiler
+from app.core.tracing import tracer
+from app.services.token_accounting import token_accountant
+
+if TYPE_CHECKING:
+    from app.services.container import ServiceContainer
+
+
+router = APIRouter()
+
+
+# ============ 请求追踪 ============
+
+@router.get(
+    "/traces",
+    summary="查看最近的请求追踪",
+    description="返回环形缓冲区中最慢（或最近）的请求及其各阶段耗时"
+)
+async def list_traces(
+    order: str = Query(default="slowest", pattern="^(slowest|recent)$", description="排序方式"),
+    limit: int = Query(default=20, ge=1, le=200, description="最大返回条数"),
+    spans: bool = Query(default=True, description="是否包含 span 明细")
+):
+    """查看最近的请求追踪"""
+    traces = tracer.slowest(limit) if order == "slowest" else tracer.recent(limit)
+    return {"traces": [t.to_dict(with_spans=spans) for t in traces]}
+
+
+@router.get(
+    "/traces/{trace_id}",
+    summary="查看单个请求追踪"
+)
+async def get_trace(trace_id: str):
+    """查看单个请求追踪"""
+    trace = tracer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"未找到追踪记录: {trace_id}")
+    return trace.to_dict()
+
+
+# ============ 采样分析 ============
+
+@router.post(
+    "/profiler/start",
+    summary="开启采样分析",
+    description="在指定时间窗口内采集调用栈，无需重启服务"
+)
+async def start_profiler(
+    seconds: float = Query(default=10.0, gt=0, le=300, description="采样时长（秒）"),
+    interval_ms: float = Query(default=5.0, ge=1, le=1000, description="采样间隔（毫秒）")
+):
+    """开启采样分析"""
+    if not profiler.start(seconds, interval_ms / 1000):
+        raise HTTPException(status_code=409, detail="已有采样正在进行")
+    return profiler.status()
+
+
+@router.post(
+    "/profiler/stop",
+    summary="停止采样分析"
+)
+async def stop_profiler():
+    """停止采样分析（等待采样线程退出，在线程中执行以免阻塞事件循环）"""
+    await asyncio.to_thread(profiler.stop)
+    return profiler.status()
+
+
+@router.get(
+    "/profiler",
+    summary="查看采样状态"
+)
+async def get_profiler_status():
+    """查看采样状态"""
+    return profiler.status()
+
+
+@router.get(
+    "/profiler/folded",
+    response_class=PlainTextResponse,
+    summary="导出采样结果",
+    description="folded 格式调用栈，可用 flamegraph.pl 或 speedscope 生成火焰图"
+)
+async def get_profiler_folded():
+    """导出采样结果"""
+    return profiler.folded()
+
+
+# ============ Token 统计 ============
+
+@router.get(
+    "/tokens",
+    summary="查看 LLM token 用量",
+    description="按接口和风格聚合的 token 用量，以及当前自适应 max_tokens"
+)
+async def get_token_usage():
+    """查看 LLM token 用量"""
+    return token_accountant.report()
+
+
+# ============ 缓存预热 ============
+
+@router.get(
+    "/warmup",
+    summary="查看缓存预热状态",
+    description="热门组合、提示词缓存命中率、预渲染库存与剩余上游预算"
+)
+async def get_warmup_status(services: "ServiceContainer" = Depends(get_services)):
+    """查看缓存预热状态"""
+    return services.warmup.report()
+
+
+@router.post(
+    "/warmup/run",
+    summary="立即执行一轮预热"
+)
+async def run_warmup(services: "ServiceContainer" = Depends(get_services)):
+    """立即执行一轮预热"""
+    spent = await services.warmup.run_once()
+    return {"upstream_calls": spent, **services.warmup.report()}
+
+
+# ============ 调用方用量 ============
+
+@router.get(
+    "/usage",
+    summary="查看所有调用方用量",
+    description="本实例记录的各调用方调用次数与被拒绝次数"
+)
+async def get_all_usage(services: "ServiceContainer" = Depends(get_services)):
+    """查看所有调用方用量"""
+    return {"users": services.quota.usage_summary()}
+
+
+# ============ 延迟模型 ============
+
+@router.get(
+    "/latency",
+    summary="查看延迟模型",
+    description="各 (后端, 尺寸, 风格数) 与 (LLM 接口, 风格数) 的衰减均值、标准差与样本权重"
+)
+async def get_latency_model(services: "ServiceContainer" = Depends(get_services)):
+    """查看延迟模型"""
+    return {
+        "llm": services.llm.latency.report(),
+        "image": services.images.router.latency.report()
+    }
+
+
+# ============ 图片去重 ============
+
+@router.get(
+    "/dedup",
+    summary="查看图片去重统计",
+    description="已登记文件数、关联的生成记录数、去重次数与节省的存储空间"
+)
+async def get_dedup_stats(services: "ServiceContainer" = Depends(get_services)):
+    """查看图片去重统计"""
+    if services.storage.dedup is None:
+        return {"enabled": False}
+    return {"enabled": True, **services.storage.dedup.stats()}
+
+
+# ============ Webhook 投递 ============
+
+@router.get(
+    "/webhooks",
+    summary="查看 webhook 投递指标",
+    description="排队事件数、投递成功/失败次数、发件箱重试与死信数，以及入队到送达的延迟分位数"
+)
+async def get_webhook_stats(services: "ServiceContainer" = Depends(get_services)):
+    """查看 webhook 投递指标"""
+    return services.webhooks.stats()
@@ -0,0 +1,88 @@
+"""
+路由依赖 - 服务注入、调用方识别与配额检查
+"""
+
+import ipaddress
+from typing import TYPE_CHECKING, Optional
+
+from fastapi import Depends, Header, HTTPException, Request
+
+from app.core.config import settings
+from app.services.quota_service import QuotaExceededError
+
+if TYPE_CHECKING:
+    from app.services.container import ServiceContainer
+
+
+def get_services(request: Request) -> "ServiceContainer":
+    """获取在 lifespan 中创建的服务容器"""
+    return request.app.state.services
+
+
+async def get_caller(
+    request: Request,
+    x_api_key: Optional[str] = Header(default=None, description="API Key")
+) -> str:
+    """
+    识别调用方
+
+    配置了 API_KEYS 时必须携带有效的 X-API-Key；否则按客户端 IP。
+    不使用客户端自报的用户标识作为限流键，否则每次请求换一个值即可绕过限流。
+    """
+    if settings.api_keys:
+        user = settings.api_keys.get(x_api_key or "")
+        if user is None:
+            raise HTTPException(status_code=401, detail="无效的 API Key")
+        return user
+    return f"ip:{client_ip(request)}"
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(proxy, strict=False) for proxy in settings.trusted_proxies)
+
+
+def client_ip(request: Request) -> str:
+    """
+    客户端 IP
+
+    直连地址属于 TRUSTED_PROXIES 时，从 X-Forwarded-For 自右向左取第一个非代理地址
+    （左侧的值可由客户端伪造），没有该头时使用 X-Real-IP；否则使用直连地址。
+    """
+    host = request.client.host if request.client else "unknown"
+    if not settings.trusted_proxies or not _is_trusted_proxy(host):
+        return host
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        for candidate in reversed([part.strip() for part in forwarded.split(",") if part.strip()]):
+            if not _is_trusted_proxy(candidate):
+                return candidate
+    return request.headers.get("x-real-ip", host).strip() or host
+
+
+async def consume_quota(services: "ServiceContainer", caller: str, action: str) -> None:
+    """消耗一次配额，超出时返回 429"""
+    try:
+        await services.quota.consume(caller, action)
+    except QuotaExceededError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def enforce_quota(action: str):
+    """生成配额检查依赖（在调用任何上游服务前执行）"""
+
+    async def dependency(
+        caller: str = Depends(get_caller),
+        services: "ServiceContainer" = Depends(get_services)
+    ) -> str:
+        await consume_quota(services, caller, action)
+        return caller
+
+    return dependency
@@ -2,27 +2,47 @@
 API 路由定义
 """
 
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from typing import TYPE_CHECKING, List, Optional
 
 from app.models.schemas import (
     GenerationRequest,
     GenerationResponse,
     RefineRequest,
     RefineResponse,
+    FinalizeResponse,
+    AcceptedResponse,
+    EstimateResponse,
+    StickerPackRequest,
     StyleInfo,
     StyleListResponse,
     SizeInfo,
     SizeListResponse,
+    SearchResponse,
+    NearDuplicateResponse,
     ErrorResponse
 )
+from app.api.deps import consume_quota, enforce_quota, get_caller, get_services
+from app.core.config import settings
+from app.core.responses import ORJSONResponse, RawJSONResponse
 from app.core.styles import STYLE_LIBRARY, SIZE_OPTIONS, PURPOSE_OPTIONS
-from app.services.generation_service import generation_service
+
+if TYPE_CHECKING:
+    from app.services.container import ServiceContainer
 
 
 router = APIRouter()
 
 
+async def _check_callback(services: "ServiceContainer", callback_url) -> None:
+    """受理回调请求前校验：未配置签名密钥时不提供回调，回调地址不能指向内网"""
+    if not services.webhooks.enabled:
+        raise HTTPException(status_code=400, detail="服务未配置 WEBHOOK_SECRET，暂不支持 callback_url")
+    rejected = await services.webhooks.check_destination(str(callback_url))
+    if rejected is not None:
+        raise HTTPException(status_code=422, detail=rejected)
+
+
 # ============ 配置接口 ============
 
 @router.get(
@@ -75,18 +95,35 @@ async def get_purposes():
     return {"purposes": PURPOSE_OPTIONS}
 
 
+@router.get(
+    "/providers",
+    summary="获取生图后端状态",
+    description="返回已注册生图后端的延迟、错误率和熔断状态"
+)
+async def get_providers(services: "ServiceContainer" = Depends(get_services)):
+    """获取生图后端状态"""
+    return {"providers": services.images.provider_status()}
+
+
 # ============ 生成接口 ============
 
 @router.post(
     "/generate",
     response_model=GenerationResponse,
     summary="生成可爱插图",
-    description="根据用户需求生成可爱风格插图，包含自动提示词优化",
+    description="根据用户需求生成可爱风格插图，包含自动提示词优化；携带 callback_url 时立即返回 202，完成后推送 webhook",
     responses={
+        202: {"model": AcceptedResponse, "description": "已受理，完成后回调"},
+        400: {"model": ErrorResponse, "description": "未启用回调"},
+        429: {"model": ErrorResponse, "description": "超出限流或配额"},
         500: {"model": ErrorResponse, "description": "生成失败"}
     }
 )
-async def generate_image(request: GenerationRequest):
+async def generate_image(
+    request: GenerationRequest,
+    caller: str = Depends(get_caller),
+    services: "ServiceContainer" = Depends(get_services)
+):
     """
     生成可爱插图
 
@@ -96,24 +133,52 @@ async def generate_image(request: GenerationRequest):
     3. 调用生图 API 生成图片
     4. 返回结果
     """
+    # 先校验回调地址，被拒绝的请求不消耗配额
+    if request.callback_url is not None:
+        await _check_callback(services, request.callback_url)
+    await consume_quota(services, caller, "generate")
+    if request.callback_url is not None:
+        return ORJSONResponse(services.generations.submit_generate(request), status_code=202)
     try:
-        result = await generation_service.generate(request)
-        return GenerationResponse(**result)
+        # 结果中的数据均已校验，直接编码返回，跳过响应模型的二次校验
+        result = await services.generations.generate(request)
+        return ORJSONResponse(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post(
+    "/estimate",
+    response_model=EstimateResponse,
+    summary="预测生成耗时",
+    description="按各后端在该尺寸/风格数下的近期实际耗时预测生成所需时间，不消耗配额"
+)
+async def estimate_generation(
+    request: GenerationRequest,
+    services: "ServiceContainer" = Depends(get_services)
+):
+    """预测生成耗时"""
+    return services.generations.estimate(request)
+
+
 @router.post(
     "/refine",
     response_model=RefineResponse,
     summary="微调图片",
-    description="基于已生成的图片进行微调，支持调整质感、比例、颜色等",
+    description="基于已生成的图片进行微调，支持调整质感、比例、颜色等；携带 callback_url 时立即返回 202，完成后推送 webhook",
     responses={
+        202: {"model": AcceptedResponse, "description": "已受理，完成后回调"},
+        400: {"model": ErrorResponse, "description": "未启用回调"},
         404: {"model": ErrorResponse, "description": "原生成记录不存在"},
+        429: {"model": ErrorResponse, "description": "超出限流或配额"},
         500: {"model": ErrorResponse, "description": "微调失败"}
     }
 )
-async def refine_image(request: RefineRequest):
+async def refine_image(
+    request: RefineRequest,
+    caller: str = Depends(get_caller),
+    services: "ServiceContainer" = Depends(get_services)
+):
     """
     微调图片
 
@@ -123,15 +188,93 @@ async def refine_image(request: RefineRequest):
     3. 重新调用生图 API
     4. 返回新结果
     """
+    # 先校验回调地址，被拒绝的请求不消耗配额
+    if request.callback_url is not None:
+        await _check_callback(services, request.callback_url)
+    await consume_quota(services, caller, "refine")
     try:
-        result = await generation_service.refine(request)
-        return RefineResponse(**result)
+        if request.callback_url is not None:
+            return ORJSONResponse(await services.generations.submit_refine(request), status_code=202)
+        result = await services.generations.refine(request)
+        return ORJSONResponse(result)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post(
+    "/generation/{generation_id}/finalize",
+    response_model=FinalizeResponse,
+    summary="草稿定稿",
+    description="用草稿的提示词和种子按请求的全尺寸重新出图；非草稿记录直接返回自身",
+    responses={
+        404: {"model": ErrorResponse, "description": "原生成记录不存在"},
+        429: {"model": ErrorResponse, "description": "超出限流或配额"},
+        500: {"model": ErrorResponse, "description": "定稿失败"}
+    }
+)
+async def finalize_generation(
+    generation_id: str,
+    caller: str = Depends(get_caller),
+    services: "ServiceContainer" = Depends(get_services)
+):
+    """草稿定稿（已定稿或非草稿记录直接返回已有结果，不消耗配额）"""
+    try:
+        result = await services.generations.finalize(
+            generation_id,
+            charge=lambda: consume_quota(services, caller, "finalize")
+        )
+        return ORJSONResponse(result)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post(
+    "/sticker-pack",
+    summary="合成贴纸包",
+    description="将多条生成记录合成为贴纸包：每张贴纸去背景、裁边并加白色描边，附拼图 sheet.png 和 index.json 索引，以 zip 返回",
+    response_class=Response,
+    responses={
+        200: {"content": {"application/zip": {}}, "description": "贴纸包 zip"},
+        404: {"model": ErrorResponse, "description": "生成记录不存在"},
+        429: {"model": ErrorResponse, "description": "超出限流或配额"},
+        500: {"model": ErrorResponse, "description": "合成失败"}
+    }
+)
+async def create_sticker_pack(
+    request: StickerPackRequest,
+    caller: str = Depends(enforce_quota("sticker_pack")),
+    services: "ServiceContainer" = Depends(get_services)
+):
+    """合成贴纸包"""
+    if len(request.generation_ids) > settings.sticker_max_items:
+        raise HTTPException(
+            status_code=422,
+            detail=f"单个贴纸包最多包含 {settings.sticker_max_items} 张图片"
+        )
+    try:
+        archive = await services.stickers.build_pack(
+            request.generation_ids,
+            columns=request.columns,
+            cell_size=request.cell_size,
+            outline=request.outline
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(
+        content=archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="sticker_pack.zip"'}
+    )
+
+
 # ============ 查询接口 ============
 
 @router.get(
@@ -139,12 +282,17 @@ async def refine_image(request: RefineRequest):
     summary="获取生成记录",
     description="根据ID获取单个生成记录详情"
 )
-async def get_generation(generation_id: str):
+async def get_generation(
+    generation_id: str,
+    services: "ServiceContainer" = Depends(get_services)
+):
     """获取生成记录"""
-    record = generation_service.get_generation(generation_id)
-    if not record:
+    encoded = await services.generations.get_generation_json(generation_id)
+    if encoded is None and services.generations.is_pending(generation_id):
+        return ORJSONResponse({"generation_id": generation_id, "status": "pending"}, status_code=202)
+    if encoded is None:
         raise HTTPException(status_code=404, detail=f"未找到生成记录: {generation_id}")
-    return record
+    return RawJSONResponse(encoded)
 
 
 @router.get(
@@ -152,9 +300,60 @@ async def get_generation(generation_id: str):
     summary="获取生成历史",
     description="获取某次生成的完整历史链，包括原始生成和所有微调版本"
 )
-async def get_generation_history(generation_id: str):
+async def get_generation_history(
+    generation_id: str,
+    services: "ServiceContainer" = Depends(get_services)
+):
     """获取生成历史"""
-    history = generation_service.get_generation_history(generation_id)
-    if not history:
+    encoded = await services.generations.get_generation_history_json(generation_id)
+    if encoded is None:
         raise HTTPException(status_code=404, detail=f"未找到生成记录: {generation_id}")
-    return {"history": history}
+    return RawJSONResponse(encoded)
+
+
+@router.get(
+    "/generation/{generation_id}/duplicates",
+    response_model=NearDuplicateResponse,
+    summary="查找近似重复",
+    description="按感知哈希查找与该记录图片近似重复的其他记录，前端可据此提示一键重新生成",
+    responses={404: {"model": ErrorResponse, "description": "生成记录不存在"}}
+)
+async def get_near_duplicates(
+    generation_id: str,
+    max_distance: Optional[int] = Query(default=None, ge=0, le=32, description="汉明距离阈值"),
+    services: "ServiceContainer" = Depends(get_services)
+):
+    """查找近似重复"""
+    try:
+        return await services.generations.find_near_duplicates(generation_id, max_distance)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get(
+    "/search",
+    response_model=SearchResponse,
+    summary="检索生成记录",
+    description="按主题、提示词、微调指令和风格关键词全文检索历史插图，结果按相关度排序"
+)
+async def search_generations(
+    q: str = Query(..., min_length=1, max_length=200, description="检索词"),
+    limit: int = Query(default=20, ge=1, le=100, description="最大返回条数"),
+    services: "ServiceContainer" = Depends(get_services)
+):
+    """检索生成记录"""
+    results = services.search.search(q, limit=limit)
+    return ORJSONResponse({"query": q, "results": results})
+
+
+@router.get(
+    "/usage",
+    summary="查看调用方用量",
+    description="返回当前调用方的各接口调用次数、当日已用额度与限流配置"
+)
+async def get_usage(
+    caller: str = Depends(get_caller),
+    services: "ServiceContainer" = Depends(get_services)
+):
+    """查看调用方用量"""
+    return await services.quota.report(caller)
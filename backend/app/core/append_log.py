@@ -0,0 +1,150 @@
+"""
+追加日志 - 内存索引的持久化（批量后台写入 + 定期压缩）
+
+请求路径只把条目放入内存队列，后台任务按间隔或条数在线程中批量追加，
+不在事件循环上做文件 IO；日志中的过期行（被覆盖的旧版本）超过有效条目
+一定比例时，按当前内存状态的快照重写日志，避免回放时间与磁盘占用无限增长。
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class AppendLog:
+    """JSON Lines 追加日志"""
+
+    def __init__(
+        self,
+        path: str,
+        snapshot: Callable[[], List[dict]],
+        live_count: Callable[[], int],
+        max_batch: int = 200,
+        flush_interval: float = 1.0,
+        compact_ratio: float = 2.0,
+        min_compact_lines: int = 1000
+    ):
+        """
+        Args:
+            path: 日志文件路径
+            snapshot: 返回当前全部有效条目（压缩时重写为新日志）
+            live_count: 当前有效条目数（用于判断是否需要压缩）
+            max_batch: 累计条数达到该值时立即写入
+            flush_interval: 后台写入间隔（秒）
+            compact_ratio: 日志行数超过有效条目数的该倍数时压缩
+            min_compact_lines: 行数低于该值时不压缩
+        """
+        self.path = path
+        self.snapshot = snapshot
+        self.live_count = live_count
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.compact_ratio = compact_ratio
+        self.min_compact_lines = min_compact_lines
+        self._pending: List[dict] = []
+        self._lines = 0
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.compactions = 0
+
+    # ============ 读取 ============
+
+    def replay(self) -> Iterator[dict]:
+        """逐条读取日志（启动时在线程中调用）"""
+        self._lines = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断可能留下不完整的末行
+                    continue
+                self._lines += 1
+                yield entry
+
+    # ============ 写入 ============
+
+    def append(self, entry: dict) -> None:
+        """加入写入队列（不做 IO）"""
+        self._pending.append(entry)
+        if len(self._pending) >= self.max_batch:
+            self._flush_requested.set()
+
+    def _write(self, entries: List[dict], mode: str) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        target = self.path if mode == "a" else f"{self.path}.tmp"
+        with open(target, mode, encoding="utf-8") as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        if mode == "w":
+            os.replace(target, self.path)
+
+    async def flush(self) -> None:
+        """批量追加队列中的条目，必要时压缩"""
+        async with self._flush_lock:
+            if self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    await asyncio.to_thread(self._write, batch, "a")
+                except Exception:
+                    logger.exception("追加日志写入失败，%d 条将重试: %s", len(batch), self.path)
+                    self._pending = batch + self._pending
+                    return
+                self._lines += len(batch)
+            if self._lines >= self.min_compact_lines and self._lines > self.live_count() * self.compact_ratio:
+                await self._compact()
+
+    async def _compact(self) -> None:
+        # 快照在事件循环上取（与内存状态一致，已包含队列中尚未写入的条目），序列化与写文件在线程中
+        entries = self.snapshot()
+        pending, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._write, entries, "w")
+        except Exception:
+            logger.exception("追加日志压缩失败: %s", self.path)
+            self._pending = pending + self._pending
+            return
+        self._lines = len(entries)
+        self.compactions += 1
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    # ============ 生命周期 ============
+
+    def start(self) -> None:
+        """启动后台写入任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """停止后台任务并写入剩余条目"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"lines": self._lines, "pending": len(self._pending), "compactions": self.compactions}
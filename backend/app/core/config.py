@@ -1,18 +1,98 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Dict, List, Literal, Optional
 
 
 class Settings(BaseSettings):
     # DeepSeek API 配置
     deepseek_api_key: str = ""
     deepseek_base_url: str = "https://api.deepseek.com/v1"
+    # 输出 token 上限（默认值 / 自适应下限）
+    llm_max_tokens: int = 1000
+    llm_min_max_tokens: int = 150
 
     # 豆包生图 API 配置
     doubao_api_key: str = ""
     doubao_base_url: str = "https://visual.volcengineapi.com"
+    doubao_image_model: str = "doubao-seedream-3-0-t2i-250415"
 
-    # 数据库配置
+    # 额外生图后端（JSON 列表），每项支持 name/base_url/api_key/model/timeout/max_concurrency
+    # 例：IMAGE_PROVIDERS='[{"name": "doubao-backup", "base_url": "https://...", "api_key": "..."}]'
+    image_providers: List[Dict[str, Any]] = []
+
+    # 生图响应格式：url（后端图片链接）/ b64_json（流式解码保存到本地，返回本地 URL）
+    image_response_format: Literal["url", "b64_json"] = "url"
+    image_storage_dir: str = "data/images"
+    image_public_path: str = "/static/images"
+    image_public_base_url: str = ""
+
+    # 数据库配置（目前支持 sqlite:///path/to/file.db）
     database_url: Optional[str] = None
+    # 写后缓冲：累计条数或间隔秒数达到阈值即批量落盘
+    record_flush_batch_size: int = 200
+    record_flush_interval: float = 1.0
+
+    # 优化提示词缓存
+    prompt_cache_size: int = 5000
+    prompt_cache_ttl: int = 6 * 3600
+
+    # 缓存预热：从请求历史学习热门组合，在低峰时段预计算提示词（可选预渲染图片）
+    warmup_enabled: bool = False
+    warmup_interval: int = 60
+    warmup_top_n: int = 300
+    warmup_offpeak_hours: List[int] = [1, 2, 3, 4, 5, 6]
+    warmup_budget_per_hour: int = 200
+    warmup_refresh_margin: int = 1800
+    warmup_include_images: bool = False
+
+    # 检索索引配置（为空则不持久化；未配置 DATABASE_URL 时记录不持久化，索引也不持久化）
+    search_index_path: Optional[str] = "data/search_index.jsonl"
+
+    # 预编码记录 JSON 的缓存条数
+    encoded_cache_size: int = 10000
+
+    # 请求追踪 / 调试接口
+    trace_buffer_size: int = 500
+    enable_debug_endpoints: bool = False
+
+    # 延迟模型：按 (后端, 尺寸, 风格数) 学习耗时，设置单次超时与重试截止时间
+    llm_timeout: float = 30.0
+    image_retry_deadline: float = 300.0
+    latency_half_life: float = 1800.0
+
+    # 本地图片去重：内容相同只存一份，感知哈希距离在阈值内视为近似重复
+    image_dedup_enabled: bool = True
+    image_hash_index_path: Optional[str] = "data/image_hashes.jsonl"
+    near_duplicate_distance: int = 6
+
+    # CPU 密集任务（贴纸合成、感知哈希）的共享进程池大小
+    worker_processes: int = 2
+
+    # 单个贴纸包最多包含的记录数
+    sticker_max_items: int = 24
+
+    # Webhook 回调：签名密钥（未配置时不接受回调）、同一地址的合并窗口与批量上限、失败批次的发件箱
+    webhook_secret: str = ""
+    webhook_batch_window: float = 0.5
+    webhook_max_batch: int = 50
+    webhook_max_attempts: int = 8
+    webhook_retry_concurrency: int = 16
+    webhook_outbox_path: Optional[str] = "data/webhook_outbox.db"
+    # 回调主机白名单（含子域名），例：WEBHOOK_ALLOWED_HOSTS='["partner.example.com"]'；为空表示不限制
+    webhook_allowed_hosts: List[str] = []
+    # 允许回调到内网/本机地址（仅用于本地测试）
+    webhook_allow_private: bool = False
+
+    # 调用方识别与配额（限流/配额为 0 表示不限制，默认不限制）
+    # 例：API_KEYS='{"sk-xxx": "partner_a"}'，配置后所有生成接口必须携带 X-API-Key
+    api_keys: Dict[str, str] = {}
+    rate_limit_window: int = 60
+    rate_limit_per_window: int = 0
+    daily_quota: int = 0
+    # 未配置 API_KEYS 时按客户端 IP 计数；经反向代理访问时需列出代理地址（IP 或网段），
+    # 才会从 X-Forwarded-For / X-Real-IP 取真实客户端，例：TRUSTED_PROXIES='["172.16.0.0/12"]'
+    trusted_proxies: List[str] = []
+    # 多实例部署时共享计数（需安装 redis 包），例：redis://localhost:6379/0
+    quota_redis_url: Optional[str] = None
 
     # 服务配置
     debug: bool = False
@@ -0,0 +1,110 @@
+"""
+采样分析器 - 按固定间隔采集线程调用栈，输出火焰图兼容的 folded 格式
+
+folded 格式每行为 "frame;frame;frame count"，可直接交给 flamegraph.pl
+或 speedscope 渲染。
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    """后台线程采样分析器（同一时间只允许一个采样窗口）"""
+
+    def __init__(self, max_depth: int = 64):
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._started_at: Optional[float] = None
+        self._duration = 0.0
+        self._interval = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float, interval: float = 0.005) -> bool:
+        """
+        开始一个采样窗口
+
+        Args:
+            duration: 采样时长（秒），到时自动停止
+            interval: 采样间隔（秒）
+
+        Returns:
+            是否成功启动（已有采样在运行时返回 False）
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks = Counter()
+            self._samples = 0
+            self._started_at = time.time()
+            self._duration = duration
+            self._interval = interval
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(duration, interval),
+                name="sampling-profiler",
+                daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self) -> None:
+        """提前结束采样"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, duration: float, interval: float) -> None:
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                self._stacks[self._fold(frame)] += 1
+            self._samples += 1
+            self._stop.wait(interval)
+
+    def _fold(self, frame) -> str:
+        """将调用栈折叠为 root;...;leaf 形式"""
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def folded(self) -> str:
+        """采样结果（folded 格式文本）"""
+        # 采样线程可能仍在写入，先在 GIL 保护下整体复制一份
+        stacks = dict(self._stacks)
+        return "\n".join(
+            f"{stack} {count}"
+            for stack, count in sorted(stacks.items(), key=lambda item: item[1], reverse=True)
+        )
+
+    def status(self) -> dict:
+        """采样状态"""
+        return {
+            "running": self.running,
+            "started_at": self._started_at,
+            "duration": self._duration,
+            "interval": self._interval,
+            "samples": self._samples,
+            "unique_stacks": len(self._stacks)
+        }
+
+
+# 全局采样分析器
+profiler = SamplingProfiler()
@@ -0,0 +1,21 @@
+"""
+高性能 JSON 响应类
+"""
+
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+
+class ORJSONResponse(JSONResponse):
+    """使用 orjson 序列化的 JSON 响应（比标准库 json 快数倍）"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class RawJSONResponse(Response):
+    """直接返回已编码 JSON 字节的响应，跳过任何序列化"""
+
+    media_type = "application/json"
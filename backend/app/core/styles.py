@@ -129,6 +129,33 @@ SIZE_OPTIONS: Dict[str, Dict] = {
 }
 
 
+# 草稿模式短边像素（与最小尺寸 square_small 一致）
+DRAFT_SHORT_SIDE = 512
+
+
+def get_draft_dimensions(size_id: str) -> tuple:
+    """
+    获取草稿尺寸：同比例中最小的预置尺寸，短边超过 DRAFT_SHORT_SIDE 时等比缩小
+
+    Returns:
+        (宽, 高)
+    """
+    target = SIZE_OPTIONS.get(size_id, SIZE_OPTIONS["square_medium"])
+    candidates = [
+        tuple(int(v) for v in option["size"].split("x"))
+        for option in SIZE_OPTIONS.values()
+        if option["ratio"] == target["ratio"]
+    ]
+    width, height = min(candidates, key=lambda wh: wh[0] * wh[1])
+    short_side = min(width, height)
+    if short_side > DRAFT_SHORT_SIDE:
+        scale = DRAFT_SHORT_SIDE / short_side
+        # 长边对齐到 16 像素
+        width = max(DRAFT_SHORT_SIDE, round(width * scale / 16) * 16)
+        height = max(DRAFT_SHORT_SIDE, round(height * scale / 16) * 16)
+    return width, height
+
+
 # 用途场景
 PURPOSE_OPTIONS: List[Dict] = [
     {"id": "social_media", "name": "社交媒体配图"},
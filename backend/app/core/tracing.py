@@ -0,0 +1,132 @@
+"""
+请求追踪 - 每个请求一个 trace，各阶段/重试记录为 span，保存在内存环形缓冲区
+"""
+
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+
+class Span:
+    """追踪片段"""
+
+    __slots__ = ("name", "start", "end", "attrs", "error")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attrs = attrs
+        self.error: Optional[str] = None
+
+    def to_dict(self, origin: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round((end - self.start) * 1000, 2),
+            "attrs": self.attrs,
+            "error": self.error
+        }
+
+
+class Trace:
+    """单个请求的追踪记录"""
+
+    __slots__ = ("trace_id", "name", "started_at", "start", "end", "spans", "status")
+
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id = trace_id
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.spans: List[Span] = []
+        self.status: Optional[int] = None
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def to_dict(self, with_spans: bool = True) -> dict:
+        data = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "status": self.status,
+            "span_count": len(self.spans)
+        }
+        if with_spans:
+            data["spans"] = [s.to_dict(self.start) for s in self.spans]
+        return data
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class Tracer:
+    """追踪器：管理当前请求的 trace 与最近完成的 trace"""
+
+    def __init__(self, capacity: int = 500):
+        self._buffer: deque = deque(maxlen=capacity)
+
+    def start_trace(self, name: str, trace_id: Optional[str] = None) -> tuple:
+        """开始一个 trace，返回 (trace, contextvar token)"""
+        trace = Trace(trace_id or uuid.uuid4().hex, name)
+        return trace, _current_trace.set(trace)
+
+    def finish_trace(self, trace: Trace, token, status: Optional[int] = None) -> None:
+        """结束 trace 并写入环形缓冲区"""
+        trace.end = time.perf_counter()
+        trace.status = status
+        _current_trace.reset(token)
+        self._buffer.append(trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        记录一个阶段的耗时（无活动 trace 时不做任何事）
+
+        用法：
+            with tracer.span("llm.call", endpoint="optimize"):
+                ...
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            yield None
+            return
+        span = Span(name, attrs)
+        trace.spans.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.perf_counter()
+
+    def recent(self, limit: int = 20) -> List[Trace]:
+        """最近完成的 trace（新的在前）"""
+        return list(reversed(self._buffer))[:limit]
+
+    def slowest(self, limit: int = 20) -> List[Trace]:
+        """缓冲区内最慢的 trace"""
+        return sorted(self._buffer, key=lambda t: t.duration, reverse=True)[:limit]
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        """按 id 查找 trace"""
+        for trace in self._buffer:
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+
+# 全局追踪器
+tracer = Tracer(capacity=settings.trace_buffer_size)
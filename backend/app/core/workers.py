@@ -0,0 +1,76 @@
+"""
+共享进程池 - 图片合成、感知哈希等 CPU 密集任务在独立进程中执行，不阻塞事件循环
+"""
+
+import asyncio
+import importlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取共享进程池（首次使用时创建）"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.worker_processes)
+    return _executor
+
+
+async def run_in_process(func: Callable, *args: Any) -> Any:
+    """
+    在共享进程池中执行函数（函数与参数需可被 pickle）
+
+    工作进程异常退出（如内存不足被杀）会使整个进程池损坏，此后提交的任务全部失败；
+    此时丢弃损坏的进程池，在新进程池中重试一次。
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        _discard_broken(pool)
+        return await loop.run_in_executor(get_process_pool(), func, *args)
+
+
+def _discard_broken(pool: ProcessPoolExecutor) -> None:
+    """丢弃损坏的进程池（并发任务可能已换上新进程池，只处理仍是当前的那个）"""
+    global _executor
+    if _executor is pool:
+        _executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _preload(modules: tuple) -> int:
+    """工作进程内预先导入模块"""
+    for module in modules:
+        importlib.import_module(module)
+    return os.getpid()
+
+
+async def warm_process_pool(*modules: str) -> None:
+    """拉起全部工作进程并预先导入指定模块，避免首个任务承担进程启动与导入开销"""
+    pool = get_process_pool()
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(*(
+            loop.run_in_executor(pool, _preload, modules) for _ in range(settings.worker_processes)
+        ))
+    except BrokenProcessPool:
+        # 损坏的进程池无法再提交任务，丢弃后由下次调用重新创建
+        _discard_broken(pool)
+        raise
+
+
+def shutdown_process_pool() -> None:
+    """关闭共享进程池，丢弃尚未开始的任务"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
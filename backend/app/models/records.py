@@ -0,0 +1,147 @@
+"""
+生成记录的紧凑内存表示
+
+记录在内存中长期驻留，因此使用 __slots__ 数据类替代字典：
+- 风格/尺寸枚举存为小整数编码
+- 时间戳存为整数（epoch 秒）
+- 微调记录直接引用根请求对象，而不是复制一份
+在 API 边界通过 to_dict() 还原为原有的 JSON 结构。
+"""
+
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.models.schemas import GenerationRequest, SizeEnum, StyleEnum
+
+
+# 枚举编码表（新增枚举值只能追加到末尾，以保持已持久化编码不变）
+STYLE_CODES = tuple(s.value for s in StyleEnum)
+SIZE_CODES = tuple(s.value for s in SizeEnum)
+_STYLE_INDEX = {value: code for code, value in enumerate(STYLE_CODES)}
+_SIZE_INDEX = {value: code for code, value in enumerate(SIZE_CODES)}
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """驻留高重复字符串（预设主题、用途、模型名）"""
+    return sys.intern(value) if value else value
+
+
+@dataclass(slots=True)
+class RequestSpec:
+    """紧凑的原始请求"""
+    theme: str
+    style_codes: bytes
+    size_code: int
+    purpose: Optional[str]
+    extra_description: Optional[str]
+    style_strength: float
+
+    @classmethod
+    def from_request(cls, request: GenerationRequest) -> "RequestSpec":
+        """从已校验的请求构造"""
+        return cls.from_dict(request.model_dump(mode="json"))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RequestSpec":
+        """从原有 JSON 结构构造"""
+        return cls(
+            theme=_intern(data["theme"]),
+            style_codes=bytes(_STYLE_INDEX[s] for s in data["styles"]),
+            size_code=_SIZE_INDEX[data.get("size", SizeEnum.SQUARE_MEDIUM.value)],
+            purpose=_intern(data.get("purpose")),
+            extra_description=data.get("extra_description"),
+            style_strength=data.get("style_strength", 0.8),
+        )
+
+    @property
+    def styles(self) -> list:
+        """风格ID列表"""
+        return [STYLE_CODES[code] for code in self.style_codes]
+
+    @property
+    def size(self) -> str:
+        """尺寸ID"""
+        return SIZE_CODES[self.size_code]
+
+    def to_dict(self) -> dict:
+        """还原为原有的请求 JSON 结构"""
+        return {
+            "theme": self.theme,
+            "styles": self.styles,
+            "size": self.size,
+            "purpose": self.purpose,
+            "extra_description": self.extra_description,
+            "style_strength": self.style_strength,
+        }
+
+
+@dataclass(slots=True)
+class GenerationRecord:
+    """紧凑的生成记录"""
+    generation_id: str
+    image_url: str
+    optimized_prompt: str
+    request: RequestSpec
+    seed: Optional[int]
+    model: Optional[str]
+    created_at: int
+    parent_id: Optional[str] = None
+    refine_instruction: Optional[str] = None
+    draft: bool = False
+    # 草稿定稿后的全尺寸记录ID
+    finalized_id: Optional[str] = None
+
+    def __post_init__(self):
+        self.model = _intern(self.model)
+
+    @staticmethod
+    def now() -> int:
+        """当前 epoch 秒"""
+        return int(datetime.now(timezone.utc).timestamp())
+
+    @classmethod
+    def from_dict(cls, data: dict, request: Optional[RequestSpec] = None) -> "GenerationRecord":
+        """
+        从原有 JSON 结构构造（用于从持久化存储加载）
+
+        Args:
+            data: 记录 JSON
+            request: 可共享的根请求对象（为空时从 data 重建）
+        """
+        created_at = datetime.fromisoformat(data["created_at"]).replace(tzinfo=timezone.utc)
+        return cls(
+            generation_id=data["generation_id"],
+            image_url=data["image_url"],
+            optimized_prompt=data["optimized_prompt"],
+            request=request or RequestSpec.from_dict(data["original_request"]),
+            seed=data.get("seed"),
+            model=data.get("model"),
+            created_at=int(created_at.timestamp()),
+            parent_id=data.get("parent_id"),
+            refine_instruction=data.get("refine_instruction"),
+            draft=data.get("draft", False),
+            finalized_id=data.get("finalized_generation_id"),
+        )
+
+    def to_dict(self) -> dict:
+        """还原为原有的记录 JSON 结构"""
+        record = {
+            "generation_id": self.generation_id,
+            "image_url": self.image_url,
+            "optimized_prompt": self.optimized_prompt,
+            "original_request": self.request.to_dict(),
+        }
+        if self.parent_id is not None:
+            record["refine_instruction"] = self.refine_instruction
+        record.update({
+            "seed": self.seed,
+            "model": self.model,
+            "created_at": datetime.fromtimestamp(self.created_at, timezone.utc).replace(tzinfo=None).isoformat(),
+            "parent_id": self.parent_id,
+            "draft": self.draft,
+        })
+        if self.finalized_id is not None:
+            record["finalized_generation_id"] = self.finalized_id
+        return record
@@ -2,7 +2,7 @@
 Pydantic 数据模型定义
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, HttpUrl
 from typing import Optional, List
 from enum import Enum
 
@@ -42,6 +42,8 @@ class GenerationRequest(BaseModel):
     purpose: Optional[str] = Field(default=None, description="用途场景")
     extra_description: Optional[str] = Field(default=None, description="额外自由描述", max_length=500)
     style_strength: float = Field(default=0.8, ge=0.1, le=1.0, description="风格强度")
+    draft: bool = Field(default=False, description="草稿模式：以低分辨率快速出图，满意后再 finalize 为全尺寸")
+    callback_url: Optional[HttpUrl] = Field(default=None, description="完成回调地址：提供时立即返回 202，完成后以 webhook 推送结果")
 
     class Config:
         json_schema_extra = {
@@ -60,6 +62,8 @@ class RefineRequest(BaseModel):
     """微调请求模型"""
     generation_id: str = Field(..., description="原生成记录ID")
     refine_instruction: str = Field(..., description="微调指令", min_length=1, max_length=200)
+    draft: Optional[bool] = Field(default=None, description="是否以草稿模式出图，默认沿用原记录")
+    callback_url: Optional[HttpUrl] = Field(default=None, description="完成回调地址：提供时立即返回 202，完成后以 webhook 推送结果")
 
     class Config:
         json_schema_extra = {
@@ -91,6 +95,9 @@ class GenerationResponse(BaseModel):
     image_url: str = Field(..., description="生成图片URL")
     optimized_prompt: str = Field(..., description="优化后的提示词")
     original_request: GenerationRequest = Field(..., description="原始请求")
+    seed: Optional[int] = Field(default=None, description="随机种子")
+    draft: bool = Field(default=False, description="是否为草稿")
+    eta_seconds: Optional[float] = Field(default=None, description="请求开始时的预计耗时（秒）")
 
     class Config:
         json_schema_extra = {
@@ -113,6 +120,50 @@ class RefineResponse(BaseModel):
     image_url: str = Field(..., description="新生成图片URL")
     optimized_prompt: str = Field(..., description="微调后的提示词")
     original_generation_id: str = Field(..., description="原生成记录ID")
+    seed: Optional[int] = Field(default=None, description="随机种子")
+    draft: bool = Field(default=False, description="是否为草稿")
+    eta_seconds: Optional[float] = Field(default=None, description="请求开始时的预计耗时（秒）")
+
+
+class FinalizeResponse(BaseModel):
+    """草稿定稿响应模型"""
+    generation_id: str = Field(..., description="全尺寸生成记录ID")
+    image_url: str = Field(..., description="全尺寸图片URL")
+    optimized_prompt: str = Field(..., description="提示词")
+    draft_generation_id: str = Field(..., description="草稿生成记录ID")
+    seed: Optional[int] = Field(default=None, description="随机种子")
+    eta_seconds: Optional[float] = Field(default=None, description="请求开始时的预计耗时（秒）")
+
+
+class AcceptedResponse(BaseModel):
+    """异步受理响应（携带 callback_url 的请求）"""
+    generation_id: str = Field(..., description="生成记录ID，完成后可查询或等待回调")
+    status: str = Field(default="pending", description="任务状态")
+    eta_seconds: Optional[float] = Field(default=None, description="预计耗时（秒）")
+
+
+class EstimateResponse(BaseModel):
+    """耗时预测响应"""
+    eta_seconds: float = Field(..., description="预计总耗时（秒）")
+    llm_seconds: float = Field(..., description="提示词优化预计耗时，已缓存时为 0")
+    image_seconds: float = Field(..., description="出图预计耗时")
+
+
+class StickerPackRequest(BaseModel):
+    """贴纸包请求模型"""
+    generation_ids: List[str] = Field(..., description="生成记录ID列表，顺序即拼图顺序", min_length=1)
+    columns: Optional[int] = Field(default=None, ge=1, le=12, description="拼图列数，默认接近正方形")
+    cell_size: int = Field(default=256, ge=64, le=1024, description="拼图单元格边长")
+    outline: int = Field(default=8, ge=0, le=32, description="白色描边宽度，0 表示不描边")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "generation_ids": ["gen_abc123", "gen_def456", "gen_ghi789"],
+                "cell_size": 256,
+                "outline": 8
+            }
+        }
 
 
 class StyleInfo(BaseModel):
@@ -143,6 +194,40 @@ class SizeListResponse(BaseModel):
     sizes: List[SizeInfo]
 
 
+class SearchResult(BaseModel):
+    """检索结果条目"""
+    generation_id: str
+    image_url: str
+    theme: str
+    optimized_prompt: str
+    styles: List[str]
+    refine_instruction: Optional[str] = None
+    parent_id: Optional[str] = None
+    created_at: Optional[str] = None
+    score: float = Field(..., description="相关度得分")
+
+
+class SearchResponse(BaseModel):
+    """检索响应"""
+    query: str
+    results: List[SearchResult]
+
+
+class NearDuplicate(BaseModel):
+    """近似重复条目"""
+    generation_id: str
+    image_url: str
+    distance: int = Field(..., description="感知哈希汉明距离，0 表示几乎相同")
+
+
+class NearDuplicateResponse(BaseModel):
+    """近似重复查询响应"""
+    generation_id: str
+    indexed: bool = Field(..., description="图片是否已计算感知哈希（仅本地存储的图片）")
+    is_duplicate: bool = Field(..., description="是否与其他记录近似重复，可提示用户重新生成")
+    matches: List[NearDuplicate]
+
+
 class ErrorResponse(BaseModel):
     """错误响应模型"""
     error: str
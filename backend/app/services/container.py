@@ -0,0 +1,153 @@
+"""
+服务容器 - 在应用 lifespan 中按依赖顺序创建所有服务，并管理启动、预热与关闭
+
+导入本模块不创建任何服务；路由通过依赖注入从 app.state.services 获取实例。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.workers import shutdown_process_pool, warm_process_pool
+from app.services.generation_service import GenerationService
+from app.services.image_dedup import build_image_dedup
+from app.services.image_service import build_image_service
+from app.services.image_storage import build_image_storage
+from app.services.llm_service import LLMService
+from app.services.quota_service import build_quota_service
+from app.services.record_store import build_record_buffer
+from app.services.search_service import SearchService
+from app.services.sticker_service import StickerPackService
+from app.services.warmup_service import build_warmup_service
+from app.services.webhook_service import build_webhook_service
+
+
+logger = logging.getLogger(__name__)
+
+# 预热失败后的重试间隔（秒）：从 1 秒开始翻倍，最长 30 秒
+_WARM_RETRY_INITIAL = 1.0
+_WARM_RETRY_MAX = 30.0
+
+
+class ServiceContainer:
+    """应用内所有服务实例"""
+
+    def __init__(self):
+        self.created_at = time.monotonic()
+        self.llm = LLMService()
+        self.record_buffer = build_record_buffer(settings.database_url)
+        self.dedup = build_image_dedup(persist_links=self.record_buffer is not None)
+        self.storage = build_image_storage(self.dedup)
+        self.images = build_image_service(self.storage)
+        # 检索索引只引用记录ID：记录仅在内存中时，重启后索引命中的记录均已不存在，不持久化
+        self.search = SearchService(
+            index_path=settings.search_index_path if self.record_buffer is not None else None
+        )
+        self.warmup = build_warmup_service(self.llm, self.images)
+        self.webhooks = build_webhook_service()
+        self.quota = build_quota_service()
+        self.generations = GenerationService(
+            llm=self.llm,
+            images=self.images,
+            storage=self.storage,
+            search=self.search,
+            warmup=self.warmup,
+            webhooks=self.webhooks,
+            encoded_cache_size=settings.encoded_cache_size,
+            store_buffer=self.record_buffer
+        )
+        self.stickers = StickerPackService(storage=self.storage, generations=self.generations)
+
+        # 就绪检查项：连接池与工作进程在后台预热，完成前 /ready 返回 503
+        self.checks: Dict[str, bool] = {"indexes": False, "http_pools": False, "process_pool": False}
+        self.ready_at: Optional[float] = None
+        self._warm_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """
+        启动服务
+
+        索引在线程中并行加载并等待完成（保证检索与去重结果完整）；
+        连接池与进程池的预热放到后台，不阻塞首个请求。
+        """
+        loaders = [asyncio.to_thread(self.search.load)]
+        if self.dedup is not None:
+            loaders.append(asyncio.to_thread(self.dedup.load))
+        await asyncio.gather(*loaders)
+        self.checks["indexes"] = True
+
+        self.search.start()
+        if self.dedup is not None:
+            self.dedup.start()
+        if self.record_buffer is not None:
+            self.record_buffer.start()
+        if settings.warmup_enabled:
+            self.warmup.start()
+        self.webhooks.start()
+        self._warm_task = asyncio.create_task(self._warm())
+
+    async def _warm(self) -> None:
+        """后台预热：建立上游连接、拉起工作进程并预加载图像模块（失败按退避重试，直到成功）"""
+        async def http_pools() -> None:
+            await asyncio.gather(self.llm.warm(), self.images.warm())
+
+        async def process_pool() -> None:
+            await warm_process_pool(
+                "app.services.image_hashing",
+                "app.services.sticker_compositor"
+            )
+
+        await asyncio.gather(
+            self._warm_with_retry("http_pools", http_pools),
+            self._warm_with_retry("process_pool", process_pool)
+        )
+        if all(self.checks.values()):
+            self.ready_at = time.monotonic()
+
+    async def _warm_with_retry(self, check: str, warm: Callable[[], Awaitable[None]]) -> None:
+        """执行单项预热，失败后按指数退避重试（上限 _WARM_RETRY_MAX 秒）"""
+        delay = _WARM_RETRY_INITIAL
+        attempt = 1
+        while True:
+            try:
+                await warm()
+            except Exception as e:
+                logger.warning("启动预热失败（%s，第 %d 次），%.1f 秒后重试: %r", check, attempt, delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _WARM_RETRY_MAX)
+                attempt += 1
+                continue
+            self.checks[check] = True
+            return
+
+    def readiness(self) -> dict:
+        """就绪状态"""
+        return {
+            "ready": self.ready_at is not None,
+            "checks": dict(self.checks),
+            "seconds_to_ready": round(self.ready_at - self.created_at, 3) if self.ready_at else None
+        }
+
+    async def aclose(self) -> None:
+        """停止后台任务、刷盘未持久化的记录并释放连接池与进程池"""
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            await asyncio.gather(self._warm_task, return_exceptions=True)
+        await self.warmup.stop()
+        # 等待进行中的回调任务完成并投递（未送达的事件进入发件箱）
+        await self.generations.wait_background()
+        await self.webhooks.stop()
+        # 最后一批回调已投递或写入发件箱，此后不再访问发件箱
+        self.webhooks.outbox.close()
+        if self.record_buffer is not None:
+            await self.record_buffer.stop()
+            self.record_buffer.store.close()
+        await self.search.stop()
+        if self.dedup is not None:
+            await self.dedup.stop()
+        await self.images.aclose()
+        await self.llm.aclose()
+        await self.stickers.aclose()
+        shutdown_process_pool()
@@ -2,151 +2,554 @@
 图片生成业务服务 - 整合 LLM 和生图服务
 """
 
+import asyncio
+import logging
+import random
 import uuid
-from typing import Dict, Optional
-from datetime import datetime
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
 
-from app.services.llm_service import llm_service
-from app.services.image_service import image_service
+import orjson
+
+from app.core.tracing import tracer
+from app.models.records import GenerationRecord, RequestSpec
+from app.services.llm_service import LLMService
+from app.services.image_service import ImageService
+from app.services.image_storage import ImageStorage
+from app.services.record_store import WriteBehindBuffer
+from app.services.search_service import SearchService
+from app.services.warmup_service import WarmupService
+from app.services.webhook_service import WebhookService
 from app.models.schemas import GenerationRequest, RefineRequest
 
 
+logger = logging.getLogger(__name__)
+
+
 class GenerationService:
     """图片生成业务服务"""
 
-    def __init__(self):
-        # 内存存储（生产环境应使用数据库）
-        self._generations: Dict[str, dict] = {}
+    def __init__(
+        self,
+        llm: LLMService,
+        images: ImageService,
+        storage: ImageStorage,
+        search: SearchService,
+        warmup: WarmupService,
+        webhooks: WebhookService,
+        encoded_cache_size: int = 10000,
+        store_buffer: Optional[WriteBehindBuffer] = None
+    ):
+        self.llm = llm
+        self.images = images
+        self.storage = storage
+        self.search = search
+        self.warmup = warmup
+        self.webhooks = webhooks
+        # 内存存储：本进程写入的记录与从持久化存储加载过的记录
+        self._generations: Dict[str, GenerationRecord] = {}
+        # 持久化写后缓冲（未配置数据库时为 None）
+        self._store_buffer = store_buffer
+        # 预编码 JSON 的 LRU 缓存：新写入和近期读取的记录直接返回字节
+        self._encoded: "OrderedDict[str, bytes]" = OrderedDict()
+        self._encoded_cache_size = encoded_cache_size
+        # 子版本已全部在内存中的记录（本进程创建的记录，或已从持久化存储补齐过子版本）
+        self._children_loaded: Set[str] = set()
+        # 进行中的定稿：草稿ID -> 出图任务（并发定稿同一草稿时共享同一次出图）
+        self._finalizing: Dict[str, asyncio.Task] = {}
+        # 带回调的后台任务：生成ID -> 任务类型
+        self._pending: Dict[str, str] = {}
+        self._background: Set[asyncio.Task] = set()
 
     def _generate_id(self) -> str:
         """生成唯一ID"""
         return f"gen_{uuid.uuid4().hex[:12]}"
 
-    async def generate(self, request: GenerationRequest) -> dict:
+    def _generate_seed(self) -> int:
+        """生成固定种子（草稿需要用同一种子在定稿时复现构图）"""
+        return random.randint(1, 2 ** 31 - 1)
+
+    def _cache_encoded(self, generation_id: str, encoded: bytes) -> None:
+        """写入预编码缓存，超出容量时淘汰最久未使用的记录"""
+        self._encoded[generation_id] = encoded
+        self._encoded.move_to_end(generation_id)
+        if len(self._encoded) > self._encoded_cache_size:
+            self._encoded.popitem(last=False)
+
+    def _encode(self, record: GenerationRecord) -> bytes:
+        """获取记录的 JSON 编码（优先命中缓存）"""
+        encoded = self._encoded.get(record.generation_id)
+        if encoded is None:
+            encoded = orjson.dumps(record.to_dict())
+            self._cache_encoded(record.generation_id, encoded)
+        else:
+            self._encoded.move_to_end(record.generation_id)
+        return encoded
+
+    def _save_record(self, record: GenerationRecord) -> None:
+        """保存生成记录，并在写入时编码一次 JSON（持久化由写后缓冲异步批量完成）"""
+        self._generations[record.generation_id] = record
+        self._children_loaded.add(record.generation_id)
+        record_dict = record.to_dict()
+        encoded = orjson.dumps(record_dict)
+        self._cache_encoded(record.generation_id, encoded)
+        self.search.index_record(record_dict)
+        self._link_image(record)
+        if self._store_buffer is not None:
+            self._store_buffer.add((record.generation_id, record.parent_id, record.created_at, encoded))
+
+    def _update_record(self, record: GenerationRecord) -> None:
+        """记录字段变更后刷新编码缓存与持久化（不重建检索索引）"""
+        encoded = orjson.dumps(record.to_dict())
+        self._cache_encoded(record.generation_id, encoded)
+        if self._store_buffer is not None:
+            self._store_buffer.add((record.generation_id, record.parent_id, record.created_at, encoded))
+
+    def _link_image(self, record: GenerationRecord) -> None:
+        """登记记录引用的本地图片（用于近似重复查询）"""
+        if self.storage.dedup is None:
+            return
+        filename = self.storage.filename_for(record.image_url)
+        if filename is not None:
+            self.storage.dedup.link(filename, record.generation_id)
+
+    def _load_record(self, encoded: bytes) -> GenerationRecord:
+        """从持久化 JSON 加载记录到内存"""
+        record = GenerationRecord.from_dict(orjson.loads(encoded))
+        self._generations[record.generation_id] = record
+        return record
+
+    async def _lookup(self, generation_id: str) -> Optional[GenerationRecord]:
+        """按ID查找记录：内存 -> 未落盘缓冲 -> 持久化存储（在线程中读取，不阻塞事件循环）"""
+        record = self._generations.get(generation_id)
+        if record is not None or self._store_buffer is None:
+            return record
+        encoded = self._store_buffer.get(generation_id)
+        if encoded is None:
+            encoded = await asyncio.to_thread(self._store_buffer.store.get, generation_id)
+        return self._load_record(encoded) if encoded else None
+
+    def estimate(self, request: GenerationRequest) -> dict:
+        """
+        预测生成耗时：提示词已缓存时不计 LLM 耗时
+
+        Returns:
+            {"eta_seconds", "llm_seconds", "image_seconds"}
+        """
+        styles = [s.value for s in request.styles]
+        cache_key = self.llm.prompt_cache_key(
+            request.theme, styles, request.size.value, request.purpose, request.extra_description
+        )
+        llm_seconds = 0.0 if cache_key in self.llm.prompt_cache else self.llm.estimate("optimize", len(styles))
+        image_seconds = self.images.estimate(request.size.value, len(styles), request.draft)
+        return {
+            "eta_seconds": round(llm_seconds + image_seconds, 1),
+            "llm_seconds": round(llm_seconds, 1),
+            "image_seconds": round(image_seconds, 1)
+        }
+
+    async def generate(self, request: GenerationRequest, generation_id: Optional[str] = None) -> dict:
         """
         完整生成流程：需求 -> 提示词优化 -> 生图 -> 返回结果
 
         Args:
             request: 生成请求
+            generation_id: 预先分配的记录ID（异步回调任务使用）
 
         Returns:
             生成结果
         """
-        generation_id = self._generate_id()
-
-        # 1. LLM 优化提示词
-        optimized_prompt = await llm_service.optimize_prompt(
+        generation_id = generation_id or self._generate_id()
+        styles = [s.value for s in request.styles]
+        eta_seconds = self.estimate(request)["eta_seconds"]
+        self.warmup.record_request(
             theme=request.theme,
-            styles=[s.value for s in request.styles],
+            styles=styles,
             size=request.size.value,
             purpose=request.purpose,
-            extra_description=request.extra_description
+            extra_description=request.extra_description,
+            style_strength=request.style_strength
         )
 
-        # 2. 调用生图 API
-        image_result = await image_service.generate_image_with_retry(
-            prompt=optimized_prompt,
+        # 1. 全尺寸请求优先使用预渲染库存（图片与生成它的提示词一并取出，保证记录一致）
+        stocked = None if request.draft else self.warmup.take_image(
+            theme=request.theme,
+            styles=styles,
             size=request.size.value,
+            purpose=request.purpose,
+            extra_description=request.extra_description,
             style_strength=request.style_strength
         )
+        if stocked is not None:
+            optimized_prompt, image_result = stocked["prompt"], stocked["result"]
+        else:
+            # 2. LLM 优化提示词（热门组合通常直接命中缓存）
+            with tracer.span("generate.optimize_prompt", styles=len(request.styles)):
+                optimized_prompt = await self.llm.optimize_prompt(
+                    theme=request.theme,
+                    styles=styles,
+                    size=request.size.value,
+                    purpose=request.purpose,
+                    extra_description=request.extra_description
+                )
 
-        # 3. 存储生成记录
-        generation_record = {
-            "generation_id": generation_id,
-            "image_url": image_result["image_url"],
-            "optimized_prompt": optimized_prompt,
-            "original_request": request.model_dump(),
-            "seed": image_result.get("seed"),
-            "model": image_result.get("model"),
-            "created_at": datetime.utcnow().isoformat(),
-            "parent_id": None  # 非微调生成
-        }
-        self._generations[generation_id] = generation_record
+            # 3. 调用生图 API（草稿模式固定种子、以小尺寸出图）
+            seed = self._generate_seed() if request.draft else None
+            with tracer.span("generate.image", size=request.size.value, draft=request.draft):
+                image_result = await self.images.generate_image_with_retry(
+                    prompt=optimized_prompt,
+                    size=request.size.value,
+                    style_strength=request.style_strength,
+                    seed=seed,
+                    draft=request.draft,
+                    style_count=len(styles)
+                )
+
+        # 4. 存储生成记录（请求已通过校验，只转换一次）
+        with tracer.span("generate.save_record", generation_id=generation_id):
+            # 与记录中保存的原始请求一致（draft 作为记录的顶层字段返回）
+            original_request = request.model_dump(mode="json", exclude={"callback_url", "draft"})
+            self._save_record(GenerationRecord(
+                generation_id=generation_id,
+                image_url=image_result["image_url"],
+                optimized_prompt=optimized_prompt,
+                request=RequestSpec.from_dict(original_request),
+                seed=image_result.get("seed"),
+                model=image_result.get("model"),
+                created_at=GenerationRecord.now(),
+                parent_id=None,  # 非微调生成
+                draft=request.draft
+            ))
 
         return {
             "generation_id": generation_id,
             "image_url": image_result["image_url"],
             "optimized_prompt": optimized_prompt,
-            "original_request": request
+            "original_request": original_request,
+            "seed": image_result.get("seed"),
+            "draft": request.draft,
+            "eta_seconds": eta_seconds
         }
 
-    async def refine(self, request: RefineRequest) -> dict:
+    async def refine(self, request: RefineRequest, generation_id: Optional[str] = None) -> dict:
         """
         微调流程：获取原提示词 -> LLM 微调 -> 重新生图
 
         Args:
             request: 微调请求
+            generation_id: 预先分配的新记录ID（异步回调任务使用）
 
         Returns:
             微调结果
         """
         # 1. 获取原生成记录
-        original = self._generations.get(request.generation_id)
+        original = await self._lookup(request.generation_id)
         if not original:
             raise ValueError(f"未找到生成记录: {request.generation_id}")
 
-        # 2. LLM 微调提示词
-        refined_prompt = await llm_service.refine_prompt(
-            original_prompt=original["optimized_prompt"],
-            refine_instruction=request.refine_instruction
+        original_request = original.request
+        draft = original.draft if request.draft is None else request.draft
+        style_count = len(original_request.styles)
+        eta_seconds = round(
+            self.llm.estimate("refine", style_count)
+            + self.images.estimate(original_request.size, style_count, draft),
+            1
         )
 
-        # 3. 重新生成图片
-        original_request = original["original_request"]
-        image_result = await image_service.generate_image_with_retry(
-            prompt=refined_prompt,
-            size=original_request.get("size", "square_medium"),
-            style_strength=original_request.get("style_strength", 0.8)
-        )
+        # 2. LLM 微调提示词
+        with tracer.span("refine.refine_prompt"):
+            refined_prompt = await self.llm.refine_prompt(
+                original_prompt=original.optimized_prompt,
+                refine_instruction=request.refine_instruction,
+                styles=original.request.styles
+            )
+
+        # 3. 重新生成图片（草稿迭代沿用原种子，保持构图稳定）
+        seed = (original.seed or self._generate_seed()) if draft else None
+        with tracer.span("refine.image", size=original_request.size, draft=draft):
+            image_result = await self.images.generate_image_with_retry(
+                prompt=refined_prompt,
+                size=original_request.size,
+                style_strength=original_request.style_strength,
+                seed=seed,
+                draft=draft,
+                style_count=style_count
+            )
 
-        # 4. 存储新的生成记录
-        new_generation_id = self._generate_id()
-        generation_record = {
+        # 4. 存储新的生成记录（引用根请求，不复制）
+        new_generation_id = generation_id or self._generate_id()
+        with tracer.span("refine.save_record", generation_id=new_generation_id):
+            self._save_record(GenerationRecord(
+                generation_id=new_generation_id,
+                image_url=image_result["image_url"],
+                optimized_prompt=refined_prompt,
+                request=original_request,
+                seed=image_result.get("seed"),
+                model=image_result.get("model"),
+                created_at=GenerationRecord.now(),
+                parent_id=request.generation_id,  # 关联原生成
+                refine_instruction=request.refine_instruction,
+                draft=draft
+            ))
+
+        return {
             "generation_id": new_generation_id,
             "image_url": image_result["image_url"],
             "optimized_prompt": refined_prompt,
-            "original_request": original_request,
-            "refine_instruction": request.refine_instruction,
+            "original_generation_id": request.generation_id,
             "seed": image_result.get("seed"),
-            "model": image_result.get("model"),
-            "created_at": datetime.utcnow().isoformat(),
-            "parent_id": request.generation_id  # 关联原生成
+            "draft": draft,
+            "eta_seconds": eta_seconds
         }
-        self._generations[new_generation_id] = generation_record
+
+    async def finalize(
+        self,
+        generation_id: str,
+        charge: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> dict:
+        """
+        定稿流程：用草稿记录的提示词和种子按全尺寸重新出图
+
+        非草稿记录本身即为全尺寸，直接返回；同一草稿重复定稿返回已有结果，
+        并发定稿等待同一次出图。
+
+        Args:
+            generation_id: 草稿生成记录ID
+            charge: 消耗配额的回调，只由实际发起出图的请求调用（超出配额时抛出的异常
+                会传给等待同一次出图的所有请求）
+
+        Returns:
+            定稿结果
+        """
+        draft = await self._lookup(generation_id)
+        if not draft:
+            raise ValueError(f"未找到生成记录: {generation_id}")
+
+        eta_seconds = 0.0
+        final = draft
+        if draft.draft:
+            final = await self._lookup(draft.finalized_id) if draft.finalized_id else None
+        if final is None:
+            eta_seconds = round(self.images.estimate(draft.request.size, len(draft.request.styles)), 1)
+            # 查找与登记之间没有 await：并发请求中只有一个创建出图任务并消耗配额
+            task = self._finalizing.get(generation_id)
+            if task is None:
+                task = asyncio.create_task(self._render_final(draft, charge))
+                self._finalizing[generation_id] = task
+                task.add_done_callback(lambda _: self._finalizing.pop(generation_id, None))
+                # 纳入后台任务，应用关闭时等待其完成并持久化定稿关系
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            # shield：某个请求被取消时不影响其他等待同一结果的请求
+            final = await asyncio.shield(task)
 
         return {
-            "generation_id": new_generation_id,
-            "image_url": image_result["image_url"],
-            "optimized_prompt": refined_prompt,
-            "original_generation_id": request.generation_id
+            "generation_id": final.generation_id,
+            "image_url": final.image_url,
+            "optimized_prompt": final.optimized_prompt,
+            "draft_generation_id": generation_id,
+            "seed": final.seed,
+            "eta_seconds": eta_seconds
         }
 
-    def get_generation(self, generation_id: str) -> Optional[dict]:
+    async def _render_final(
+        self,
+        draft: GenerationRecord,
+        charge: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> GenerationRecord:
+        """消耗配额后按全尺寸重新出图，保存定稿记录并在草稿上记下定稿ID"""
+        if charge is not None:
+            await charge()
+        with tracer.span("finalize.image", size=draft.request.size):
+            image_result = await self.images.generate_image_with_retry(
+                prompt=draft.optimized_prompt,
+                size=draft.request.size,
+                style_strength=draft.request.style_strength,
+                seed=draft.seed,
+                style_count=len(draft.request.styles)
+            )
+
+        final = GenerationRecord(
+            generation_id=self._generate_id(),
+            image_url=image_result["image_url"],
+            optimized_prompt=draft.optimized_prompt,
+            request=draft.request,
+            seed=image_result.get("seed"),
+            model=image_result.get("model"),
+            created_at=GenerationRecord.now(),
+            parent_id=draft.generation_id,
+            refine_instruction=draft.refine_instruction
+        )
+        self._save_record(final)
+        # 定稿关系随草稿记录持久化，重启后重复定稿仍返回已有结果
+        draft.finalized_id = final.generation_id
+        self._update_record(draft)
+        return final
+
+    # ============ 异步回调任务 ============
+
+    def submit_generate(self, request: GenerationRequest) -> dict:
+        """受理带 callback_url 的生成请求：立即返回记录ID，完成后推送 webhook"""
+        generation_id = self._generate_id()
+        eta_seconds = self.estimate(request)["eta_seconds"]
+        self._run_in_background(
+            generation_id, "generate", self.generate(request, generation_id), str(request.callback_url)
+        )
+        return {"generation_id": generation_id, "status": "pending", "eta_seconds": eta_seconds}
+
+    async def submit_refine(self, request: RefineRequest) -> dict:
+        """受理带 callback_url 的微调请求（原记录不存在时同步报错）"""
+        original = await self._lookup(request.generation_id)
+        if not original:
+            raise ValueError(f"未找到生成记录: {request.generation_id}")
+        generation_id = self._generate_id()
+        style_count = len(original.request.styles)
+        draft = original.draft if request.draft is None else request.draft
+        eta_seconds = round(
+            self.llm.estimate("refine", style_count)
+            + self.images.estimate(original.request.size, style_count, draft),
+            1
+        )
+        self._run_in_background(
+            generation_id, "refine", self.refine(request, generation_id), str(request.callback_url)
+        )
+        return {"generation_id": generation_id, "status": "pending", "eta_seconds": eta_seconds}
+
+    def _run_in_background(self, generation_id: str, kind: str, job: Awaitable[dict], callback_url: str) -> None:
+        self._pending[generation_id] = kind
+        task = asyncio.create_task(self._run_with_callback(generation_id, kind, job, callback_url))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _run_with_callback(self, generation_id: str, kind: str, job: Awaitable[dict], callback_url: str) -> None:
+        """执行后台任务并投递完成/失败事件（后台任务使用独立的 trace）"""
+        trace, token = tracer.start_trace(f"background {kind}")
+        status = 200
+        try:
+            result = await job
+        except asyncio.CancelledError:
+            # 应用关闭时被取消：在 webhook 服务停止前通知调用方（未送达的进入发件箱）
+            status = 503
+            self.webhooks.enqueue(callback_url, "generation.failed", {
+                "generation_id": generation_id,
+                "kind": kind,
+                "error": "服务关闭，任务已取消"
+            })
+            raise
+        except Exception as e:
+            status = 500
+            logger.exception("后台%s任务失败: %s", kind, generation_id)
+            self.webhooks.enqueue(callback_url, "generation.failed", {
+                "generation_id": generation_id,
+                "kind": kind,
+                "error": str(e)
+            })
+        else:
+            self.webhooks.enqueue(callback_url, "generation.completed", {"kind": kind, **result})
+        finally:
+            self._pending.pop(generation_id, None)
+            tracer.finish_trace(trace, token, status)
+
+    def is_pending(self, generation_id: str) -> bool:
+        """记录是否仍在后台生成中"""
+        return generation_id in self._pending
+
+    async def wait_background(self, timeout: float = 30.0) -> None:
+        """等待进行中的后台任务完成，超时后取消剩余任务并等待其退出（应用关闭时调用）"""
+        if not self._background:
+            return
+        _, pending = await asyncio.wait(set(self._background), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("关闭时仍有 %d 个后台任务未完成，已取消", len(pending))
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    # ============ 查询 ============
+
+    async def get_generation(self, generation_id: str) -> Optional[dict]:
         """获取生成记录"""
-        return self._generations.get(generation_id)
+        record = await self._lookup(generation_id)
+        return record.to_dict() if record else None
 
-    def get_generation_history(self, generation_id: str) -> list:
-        """获取生成历史链（包括所有微调版本）"""
+    async def get_generation_json(self, generation_id: str) -> Optional[bytes]:
+        """获取预编码的生成记录 JSON"""
+        record = await self._lookup(generation_id)
+        return self._encode(record) if record else None
+
+    async def find_near_duplicates(self, generation_id: str, max_distance: Optional[int] = None) -> dict:
+        """
+        查找与某条记录图片近似重复的其他记录
+
+        仅本地存储（b64_json 模式）的图片有感知哈希；其他记录返回 indexed=False。
+
+        Args:
+            generation_id: 生成记录ID
+            max_distance: dHash 汉明距离阈值，默认使用配置值
+
+        Returns:
+            {"generation_id", "indexed", "is_duplicate", "matches"}
+        """
+        record = await self._lookup(generation_id)
+        if not record:
+            raise ValueError(f"未找到生成记录: {generation_id}")
+
+        filename = self.storage.filename_for(record.image_url)
+        found = None
+        if self.storage.dedup is not None and filename is not None:
+            found = self.storage.dedup.near_duplicates(filename, max_distance)
+
+        matches = []
+        for match in found or ():
+            for other_id in match["generation_ids"]:
+                if other_id != generation_id:
+                    matches.append({
+                        "generation_id": other_id,
+                        "image_url": self.storage.url_for(match["file"]),
+                        "distance": match["distance"]
+                    })
+        return {
+            "generation_id": generation_id,
+            "indexed": found is not None,
+            "is_duplicate": bool(matches),
+            "matches": matches
+        }
+
+    async def _history_records(self, generation_id: str) -> List[GenerationRecord]:
+        """获取生成历史链上的记录对象"""
         history = []
         current_id = generation_id
 
         # 向上追溯到原始生成
         while current_id:
-            record = self._generations.get(current_id)
+            record = await self._lookup(current_id)
             if not record:
                 break
             history.insert(0, record)
-            current_id = record.get("parent_id")
+            current_id = record.parent_id
 
         # 向下查找所有子版本
-        children = [
-            r for r in self._generations.values()
-            if r.get("parent_id") == generation_id
-        ]
-        history.extend(children)
+        if self._store_buffer is not None and history and generation_id not in self._children_loaded:
+            # 补充之前运行中落盘、尚未加载到内存的子版本（每条记录只查询一次）
+            for encoded in await asyncio.to_thread(self._store_buffer.store.children, generation_id):
+                data = orjson.loads(encoded)
+                if data["generation_id"] not in self._generations:
+                    self._generations[data["generation_id"]] = GenerationRecord.from_dict(data)
+            self._children_loaded.add(generation_id)
+        history.extend(sorted(
+            (r for r in self._generations.values() if r.parent_id == generation_id),
+            key=lambda r: r.created_at
+        ))
 
         return history
 
+    async def get_generation_history(self, generation_id: str) -> list:
+        """获取生成历史链（包括所有微调版本）"""
+        return [r.to_dict() for r in await self._history_records(generation_id)]
 
-# 全局服务实例
-generation_service = GenerationService()
+    async def get_generation_history_json(self, generation_id: str) -> Optional[bytes]:
+        """获取预编码的生成历史 JSON（拼接已编码记录，不再逐条序列化）"""
+        history = await self._history_records(generation_id)
+        if not history:
+            return None
+        return b'{"history":[' + b",".join(self._encode(r) for r in history) + b"]}"
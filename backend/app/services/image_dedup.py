@@ -0,0 +1,272 @@
+"""
+图片去重 - 内容相同的文件只保留一份，感知哈希 BK 树查找近似重复
+
+- 新写入的本地图片在进程池中计算 SHA-256 与 dHash
+- SHA-256 相同：删除新文件，复用已有文件
+- dHash 汉明距离在阈值内且平均颜色接近：视为近似重复，供前端提示"换一张"
+索引以追加日志持久化（后台批量写入、定期压缩），启动时调用 load() 回放。
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.append_log import AppendLog
+from app.core.config import settings
+from app.core.workers import run_in_process
+
+
+logger = logging.getLogger(__name__)
+
+
+def hamming(a: int, b: int) -> int:
+    """汉明距离"""
+    return (a ^ b).bit_count()
+
+
+def color_distance(a: int, b: int) -> int:
+    """两个 24 位 RGB 颜色的最大通道差"""
+    return max(abs(((a >> shift) & 0xFF) - ((b >> shift) & 0xFF)) for shift in (16, 8, 0))
+
+
+class BKTree:
+    """按汉明距离组织的 BK 树，支持阈值内近邻查询"""
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self):
+        # 节点：[哈希, 条目列表, {距离: 子节点}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, item: str) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """返回 (距离, 条目)，按距离升序"""
+        results = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            # 三角不等式剪枝
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort()
+        return results
+
+
+class ImageDedupIndex:
+    """本地图片去重索引"""
+
+    def __init__(
+        self,
+        directory: str,
+        index_path: Optional[str] = None,
+        max_distance: int = 6,
+        color_tolerance: int = 24,
+        persist_links: bool = True
+    ):
+        """
+        Args:
+            directory: 图片存储目录
+            index_path: 索引日志路径（为空则不持久化）
+            max_distance: 近似重复的 dHash 汉明距离阈值
+            color_tolerance: 近似重复的平均颜色最大通道差
+            persist_links: 是否持久化文件与生成记录的对应关系（记录不持久化时关闭，
+                否则重启后近似重复结果会引用已不存在的记录）
+        """
+        self.directory = directory
+        self.max_distance = max_distance
+        self.color_tolerance = color_tolerance
+        self.persist_links = persist_links
+        # 文件名 -> dHash
+        self._hashes: Dict[str, int] = {}
+        # 文件名 -> 平均颜色
+        self._colors: Dict[str, int] = {}
+        # SHA-256 -> 文件名
+        self._by_digest: Dict[str, str] = {}
+        # 文件名 -> 引用该文件的生成记录ID
+        self._generations: Dict[str, Set[str]] = {}
+        self._tree = BKTree()
+        self._log = AppendLog(
+            index_path,
+            snapshot=self._snapshot,
+            live_count=self._live_count
+        ) if index_path else None
+        self.deduplicated = 0
+        self.bytes_saved = 0
+
+    # ============ 写入 ============
+
+    async def add(self, filename: str) -> str:
+        """
+        登记新写入的文件
+
+        Args:
+            filename: 存储目录下的文件名
+
+        Returns:
+            实际使用的文件名（内容重复时为已有文件）
+        """
+        # 延迟导入：Pillow 只在工作进程中实际使用
+        from app.services.image_hashing import fingerprint_file
+
+        path = os.path.join(self.directory, filename)
+        try:
+            digest, value, color = await run_in_process(fingerprint_file, path)
+        except Exception:
+            # 无法解码的文件不参与去重，照常使用
+            logger.exception("图片指纹计算失败: %s", filename)
+            return filename
+
+        existing = self._by_digest.get(digest)
+        if existing is not None and existing != filename and os.path.exists(
+            os.path.join(self.directory, existing)
+        ):
+            self.bytes_saved += os.path.getsize(path)
+            os.remove(path)
+            self.deduplicated += 1
+            return existing
+
+        self._apply(
+            {"op": "add", "file": filename, "sha256": digest, "dhash": value, "color": color},
+            persist=True
+        )
+        return filename
+
+    def link(self, filename: str, generation_id: str) -> None:
+        """记录生成记录与文件的对应关系"""
+        if filename in self._hashes:
+            self._apply({"op": "link", "file": filename, "generation_id": generation_id}, persist=True)
+
+    def _apply(self, entry: dict, persist: bool = False) -> None:
+        """应用一条索引变更"""
+        op, filename = entry["op"], entry["file"]
+        if op == "add":
+            self._hashes[filename] = entry["dhash"]
+            self._colors[filename] = entry["color"]
+            if entry["sha256"] is not None:
+                self._by_digest[entry["sha256"]] = filename
+            self._tree.add(entry["dhash"], filename)
+        elif op == "link":
+            self._generations.setdefault(filename, set()).add(entry["generation_id"])
+        if persist and self._log is not None and (op == "add" or self.persist_links):
+            self._log.append(entry)
+
+    # ============ 查询 ============
+
+    def near_duplicates(self, filename: str, max_distance: Optional[int] = None) -> Optional[List[dict]]:
+        """
+        查找近似重复的文件
+
+        Returns:
+            [{"file", "distance", "generation_ids"}]；文件未登记时返回 None
+        """
+        value = self._hashes.get(filename)
+        if value is None:
+            return None
+        limit = self.max_distance if max_distance is None else max_distance
+        color = self._colors[filename]
+        return [
+            {
+                "file": match,
+                "distance": distance,
+                "generation_ids": sorted(self._generations.get(match, ()))
+            }
+            for distance, match in self._tree.search(value, limit)
+            if color_distance(color, self._colors[match]) <= self.color_tolerance
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._hashes),
+            "linked_generations": sum(len(ids) for ids in self._generations.values()),
+            "deduplicated": self.deduplicated,
+            "bytes_saved": self.bytes_saved,
+            "max_distance": self.max_distance
+        }
+
+    # ============ 持久化 ============
+
+    def _snapshot(self) -> List[dict]:
+        """当前索引的全部日志条目（压缩日志时使用）"""
+        digests = {filename: digest for digest, filename in self._by_digest.items()}
+        entries = [
+            {
+                "op": "add",
+                "file": filename,
+                "sha256": digests.get(filename),
+                "dhash": value,
+                "color": self._colors[filename]
+            }
+            for filename, value in self._hashes.items()
+        ]
+        if self.persist_links:
+            entries.extend(
+                {"op": "link", "file": filename, "generation_id": generation_id}
+                for filename, ids in self._generations.items()
+                for generation_id in ids
+            )
+        return entries
+
+    def _live_count(self) -> int:
+        links = sum(len(ids) for ids in self._generations.values()) if self.persist_links else 0
+        return len(self._hashes) + links
+
+    def load(self) -> None:
+        """从索引日志恢复（启动时在线程中调用，完成前不处理请求）"""
+        if self._log is None:
+            return
+        for entry in self._log.replay():
+            # 不持久化对应关系时忽略旧日志中的 link（对应的记录已随重启丢失）
+            if entry["op"] == "link" and not self.persist_links:
+                continue
+            self._apply(entry)
+
+    def start(self) -> None:
+        """启动索引日志的后台写入"""
+        if self._log is not None:
+            self._log.start()
+
+    async def stop(self) -> None:
+        """写入剩余的索引日志"""
+        if self._log is not None:
+            await self._log.stop()
+
+
+def build_image_dedup(persist_links: bool = True) -> Optional[ImageDedupIndex]:
+    """
+    根据配置构建去重索引（关闭去重时返回 None）
+
+    Args:
+        persist_links: 生成记录是否持久化（否则只持久化文件哈希）
+    """
+    if not settings.image_dedup_enabled:
+        return None
+    return ImageDedupIndex(
+        directory=settings.image_storage_dir,
+        index_path=settings.image_hash_index_path,
+        max_distance=settings.near_duplicate_distance,
+        persist_links=persist_links
+    )
@@ -0,0 +1,46 @@
+"""
+图片指纹 - 在进程池中计算内容哈希与感知哈希（dHash）
+
+dHash：缩放为 9x8 灰度图，逐行比较相邻像素亮度得到 64 位指纹；
+重新生成、无实质变化的微调等近似图片的指纹汉明距离很小。
+dHash 只反映亮度结构，另记录平均颜色，用于区分"换个颜色"这类微调。
+"""
+
+import hashlib
+from typing import Tuple
+
+from PIL import Image
+
+_HASH_WIDTH = 9
+_HASH_HEIGHT = 8
+
+
+def dhash(image: "Image.Image") -> int:
+    """64 位差异哈希"""
+    small = image.convert("L").resize((_HASH_WIDTH, _HASH_HEIGHT), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(_HASH_HEIGHT):
+        offset = row * _HASH_WIDTH
+        for column in range(_HASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def average_color(image: "Image.Image") -> int:
+    """平均颜色，打包为 24 位 RGB 整数"""
+    red, green, blue = image.convert("RGB").resize((1, 1), Image.BOX).getpixel((0, 0))
+    return (red << 16) | (green << 8) | blue
+
+
+def fingerprint_file(path: str) -> Tuple[str, int, int]:
+    """
+    计算文件指纹
+
+    Returns:
+        (内容 SHA-256, dHash, 平均颜色)
+    """
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    with Image.open(path) as image:
+        return digest, dhash(image), average_color(image)
@@ -0,0 +1,358 @@
+"""
+生图后端抽象 - 多后端注册、健康追踪与基于延迟的路由/故障转移
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.core.tracing import tracer
+from app.services.image_storage import ImageStorage
+from app.services.latency_model import LatencyModel
+
+
+# 这些状态码说明问题出在后端本身（限流、鉴权、服务故障），可以换一个后端重试
+_FAILOVER_STATUS_CODES = {401, 403, 408, 429}
+
+
+class ProviderBusyError(Exception):
+    """后端并发已满，在限定时间内未排到槽位（不是后端故障，不计入错误率与延迟）"""
+
+
+def is_failover_error(error: Exception) -> bool:
+    """判断错误是否应切换到其他后端"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status in _FAILOVER_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, ProviderBusyError))
+
+
+class ImageProvider:
+    """单个生图后端（独立连接池、并发限制与健康统计）"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: str,
+        model: str,
+        timeout: float = 120.0,
+        max_concurrency: int = 8,
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # 健康统计
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_used = 0.0
+        self.in_flight = 0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """复用的连接池（首次使用时创建）"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                transport=self._transport
+            )
+        return self._client
+
+    def is_available(self, now: Optional[float] = None) -> bool:
+        """是否处于可用状态（未熔断）"""
+        return (now or time.monotonic()) >= self.cooldown_until
+
+    def record_success(self, latency: float, alpha: float = 0.2) -> None:
+        """记录成功调用"""
+        self.latency_ewma = latency if self.latency_ewma is None else (
+            alpha * latency + (1 - alpha) * self.latency_ewma
+        )
+        self.error_rate *= (1 - alpha)
+        self.consecutive_failures = 0
+
+    def record_failure(self, alpha: float = 0.2) -> None:
+        """记录失败调用，连续失败达到阈值后熔断一段时间"""
+        self.error_rate = alpha + (1 - alpha) * self.error_rate
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.cooldown_until = time.monotonic() + self.cooldown_seconds
+
+    def score(self, now: float, probe_interval: float) -> float:
+        """
+        路由评分（越低越优先）
+
+        期望延迟按错误率和当前负载加权；长时间未使用的后端视为未知，
+        以便在性能恢复后重新被探测到。
+        """
+        if self.latency_ewma is None or now - self.last_used > probe_interval:
+            return 0.0
+        load = 1 + self.in_flight / self.max_concurrency
+        return self.latency_ewma * (1 + 4 * self.error_rate) * load
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        占用一个并发槽位
+
+        Args:
+            timeout: 排队等待上限（秒），超时抛出 ProviderBusyError；None 表示一直等待
+        """
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise ProviderBusyError(f"生图后端 {self.name} 并发已满（等待 {timeout:.1f} 秒未排到）")
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def generate(
+        self,
+        payload: Dict[str, Any],
+        storage: Optional[ImageStorage] = None,
+        timeout: Optional[float] = None,
+        truncated: bool = False
+    ) -> dict:
+        """
+        占用槽位并调用后端生成图片（参数同 request）
+        """
+        async with self.slot():
+            return await self.request(payload, storage, timeout=timeout, truncated=truncated)
+
+    async def request(
+        self,
+        payload: Dict[str, Any],
+        storage: Optional[ImageStorage] = None,
+        timeout: Optional[float] = None,
+        truncated: bool = False
+    ) -> dict:
+        """
+        调用后端生成图片（调用方需已通过 slot() 占用槽位）
+
+        Args:
+            payload: 请求体（不含 model，由后端填充）
+            storage: b64_json 模式下的本地存储，响应体流式解码写入文件
+            timeout: 本次请求超时（秒），默认使用后端的固定超时
+            truncated: 超时已被调用方截止时间截短（此时超时不计为后端故障）
+
+        Returns:
+            后端响应 JSON（b64_json 模式下负载替换为本地 URL）
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+        self.in_flight += 1
+        self.total_requests += 1
+        self.last_used = time.monotonic()
+        start = time.perf_counter()
+        try:
+            if storage is None:
+                response = await self.client.post(
+                    "/v1/images/generations",
+                    headers=headers,
+                    json={**payload, "model": self.model},
+                    timeout=request_timeout
+                )
+                response.raise_for_status()
+                result = response.json()
+            else:
+                result = await self._generate_to_storage(payload, headers, storage, request_timeout)
+        except Exception as e:
+            if is_failover_error(e) and not (truncated and isinstance(e, httpx.TimeoutException)):
+                self.record_failure()
+            raise
+        finally:
+            self.in_flight -= 1
+        self.record_success(time.perf_counter() - start)
+        return result
+
+    async def _generate_to_storage(
+        self,
+        payload: Dict[str, Any],
+        headers: dict,
+        storage: ImageStorage,
+        timeout
+    ) -> dict:
+        """流式接收 b64_json 响应并直接解码写入本地存储"""
+        async with self.client.stream(
+            "POST",
+            "/v1/images/generations",
+            headers=headers,
+            json={**payload, "model": self.model},
+            timeout=timeout
+        ) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            filename, result = await storage.save_b64_stream(response.aiter_bytes())
+        result["data"][0]["url"] = storage.url_for(filename)
+        return result
+
+    async def warm(self) -> None:
+        """预先建立连接（TLS 握手）；连接失败时抛出 httpx.HTTPError"""
+        if not self.api_key:
+            return
+        await self.client.head("/", timeout=5.0)
+
+    def status(self) -> dict:
+        """健康状态快照"""
+        return {
+            "name": self.name,
+            "model": self.model,
+            "base_url": self.base_url,
+            "available": self.is_available(),
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures
+        }
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class ProviderRouter:
+    """按观测延迟/错误率选择后端，失败时自动切换"""
+
+    def __init__(
+        self,
+        providers: List[ImageProvider],
+        probe_interval: float = 60.0,
+        latency: Optional[LatencyModel] = None
+    ):
+        if not providers:
+            raise ValueError("至少需要配置一个生图后端")
+        self.providers = providers
+        self.probe_interval = probe_interval
+        # 按 (后端, 出图尺寸, 风格数) 学习的延迟模型，用于设置单次请求超时
+        self.latency = latency or LatencyModel(prior_base=5.0, prior_per_unit=10.0)
+
+    def ranked(self) -> List[ImageProvider]:
+        """按优先级排序的后端列表（熔断中的排在最后，作为兜底）"""
+        now = time.monotonic()
+        return sorted(
+            self.providers,
+            key=lambda p: (not p.is_available(now), p.score(now, self.probe_interval))
+        )
+
+    @staticmethod
+    def profile(payload: Dict[str, Any], style_count: int = 1) -> tuple:
+        """请求的延迟画像：(尺寸标签, 风格数, 百万像素)"""
+        width, height = payload["width"], payload["height"]
+        return f"{width}x{height}", style_count, width * height / 1_000_000
+
+    def predict(self, provider: ImageProvider, profile: tuple) -> tuple:
+        """预测某后端处理该画像请求的 (耗时, 标准差)"""
+        label, style_count, megapixels = profile
+        return self.latency.predict((provider.name, label, style_count), megapixels, provider.name)
+
+    def timeout_for(self, provider: ImageProvider, profile: tuple) -> float:
+        """某后端处理该画像请求的超时"""
+        label, style_count, megapixels = profile
+        return self.latency.timeout(
+            (provider.name, label, style_count), megapixels, provider.name, cap=provider.timeout
+        )
+
+    async def generate(
+        self,
+        payload: Dict[str, Any],
+        storage: Optional[ImageStorage] = None,
+        style_count: int = 1,
+        deadline: Optional[float] = None
+    ) -> tuple:
+        """
+        依次尝试后端直到成功
+
+        Args:
+            payload: 请求体
+            storage: b64_json 模式下的本地存储
+            style_count: 风格数（延迟画像的一部分）
+            deadline: 截止时间（time.monotonic），单次超时不会超过剩余时间
+
+        Returns:
+            (后端, 响应 JSON)
+        """
+        profile = self.profile(payload, style_count)
+        label, _, megapixels = profile
+        last_error: Optional[Exception] = None
+        for provider in self.ranked():
+            predicted = self.timeout_for(provider, profile)
+            if deadline is not None and deadline - time.monotonic() <= 0:
+                break
+            key = (provider.name, label, style_count)
+            timeout, truncated = predicted, False
+            try:
+                with tracer.span("image.provider", provider=provider.name, timeout=round(predicted, 1)):
+                    # 排队等待并发槽位同样受单次超时与截止时间约束，排不到则换下一个后端
+                    wait = predicted if deadline is None else min(predicted, deadline - time.monotonic())
+                    async with provider.slot(wait):
+                        # 计时从拿到槽位开始，排队时间不计入延迟模型
+                        if deadline is not None:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise ProviderBusyError("已超过生图截止时间")
+                            truncated = remaining < timeout
+                            timeout = min(timeout, remaining)
+                        start = time.monotonic()
+                        result = await provider.request(payload, storage, timeout=timeout, truncated=truncated)
+            except Exception as e:
+                if isinstance(e, httpx.TimeoutException) and not truncated:
+                    # 完整超时用尽说明实际耗时至少为超时时长，计入模型使预测随后端变慢而上调；
+                    # 被截止时间截短的超时只是比截短值慢，不足以说明后端变慢，不计入
+                    self.latency.observe(key, timeout, megapixels, provider.name)
+                if not is_failover_error(e):
+                    raise
+                last_error = e
+                continue
+            self.latency.observe(key, time.monotonic() - start, megapixels, provider.name)
+            return provider, result
+        raise last_error or httpx.TimeoutException("已超过生图截止时间")
+
+    async def warm(self) -> None:
+        """并发预热所有后端连接池（至少一个后端可连接即可，全部失败时抛出第一个错误）"""
+        results = await asyncio.gather(
+            *(provider.warm() for provider in self.providers), return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+
+    def status(self) -> List[dict]:
+        """所有后端的健康状态"""
+        return [p.status() for p in self.providers]
+
+    async def aclose(self) -> None:
+        """关闭所有后端连接池"""
+        for provider in self.providers:
+            await provider.aclose()
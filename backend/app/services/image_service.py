@@ -2,23 +2,55 @@
 豆包 SeeDream 生图服务
 """
 
+import time
+
 import httpx
-import hashlib
-import hmac
-import json
-from datetime import datetime, timezone
-from typing import Optional
+from typing import List, Optional
 from app.core.config import settings
-from app.core.styles import SIZE_OPTIONS
+from app.core.tracing import tracer
+from app.core.styles import SIZE_OPTIONS, get_draft_dimensions
+from app.services.image_providers import ImageProvider, ProviderRouter
+from app.services.image_storage import ImageStorage
+from app.services.latency_model import LatencyModel
+
+
+def build_providers() -> List[ImageProvider]:
+    """根据配置构建生图后端列表（默认豆包后端 + IMAGE_PROVIDERS 中的额外后端）"""
+    providers = [ImageProvider(
+        name="doubao",
+        base_url=settings.doubao_base_url,
+        api_key=settings.doubao_api_key,
+        model=settings.doubao_image_model
+    )]
+    for config in settings.image_providers:
+        providers.append(ImageProvider(
+            name=config["name"],
+            base_url=config.get("base_url", settings.doubao_base_url),
+            api_key=config.get("api_key", settings.doubao_api_key),
+            model=config.get("model", settings.doubao_image_model),
+            timeout=config.get("timeout", 120.0),
+            max_concurrency=config.get("max_concurrency", 8)
+        ))
+    return providers
 
 
 class ImageService:
     """豆包生图服务类"""
 
-    def __init__(self):
-        self.api_key = settings.doubao_api_key
-        self.base_url = settings.doubao_base_url
-        self.model = "doubao-seedream-3-0-t2i-250415"
+    def __init__(
+        self,
+        providers: Optional[List[ImageProvider]] = None,
+        response_format: str = "url",
+        storage: Optional[ImageStorage] = None,
+        latency: Optional[LatencyModel] = None,
+        retry_deadline: float = 300.0
+    ):
+        self.router = ProviderRouter(providers or build_providers(), latency=latency)
+        # 含重试在内的总耗时上限
+        self.retry_deadline = retry_deadline
+        # url：返回后端图片链接；b64_json：流式解码到本地存储并返回本地 URL
+        self.response_format = response_format
+        self.storage = storage
 
     def _get_size_dimensions(self, size_id: str) -> tuple:
         """获取尺寸的宽高"""
@@ -27,12 +59,26 @@ class ImageService:
         width, height = size_str.split("x")
         return int(width), int(height)
 
+    def _dimensions(self, size: str, draft: bool) -> tuple:
+        """实际出图宽高（草稿为同比例小尺寸）"""
+        return get_draft_dimensions(size) if draft else self._get_size_dimensions(size)
+
+    def estimate(self, size: str = "square_medium", style_count: int = 1, draft: bool = False) -> float:
+        """按当前首选后端预测单次出图耗时（秒）"""
+        width, height = self._dimensions(size, draft)
+        profile = ProviderRouter.profile({"width": width, "height": height}, style_count)
+        mean, _ = self.router.predict(self.router.ranked()[0], profile)
+        return mean
+
     async def generate_image(
         self,
         prompt: str,
         size: str = "square_medium",
         style_strength: float = 0.8,
-        seed: Optional[int] = None
+        seed: Optional[int] = None,
+        draft: bool = False,
+        style_count: int = 1,
+        deadline: Optional[float] = None
     ) -> dict:
         """
         调用豆包 SeeDream API 生成图片
@@ -42,73 +88,88 @@ class ImageService:
             size: 尺寸ID
             style_strength: 风格强度 (0.1-1.0)
             seed: 随机种子（可选，用于复现）
+            draft: 草稿模式，按同比例的小尺寸出图
+            style_count: 风格数（用于延迟预测）
+            deadline: 截止时间（time.monotonic）
 
         Returns:
             包含图片URL和元信息的字典
         """
-        width, height = self._get_size_dimensions(size)
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        width, height = self._dimensions(size, draft)
 
         payload = {
-            "model": self.model,
             "prompt": prompt,
             "width": width,
             "height": height,
             "scale": style_strength * 10,  # 转换为 1-10 的范围
             "seed": seed or -1,  # -1 表示随机
-            "response_format": "url"
+            "response_format": self.response_format
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{self.base_url}/v1/images/generations",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            result = response.json()
-
-            # 解析响应
-            image_data = result.get("data", [{}])[0]
-            return {
-                "image_url": image_data.get("url", ""),
-                "revised_prompt": image_data.get("revised_prompt", prompt),
-                "seed": result.get("seed"),
-                "model": self.model
-            }
+        # 路由到当前最优后端，失败时自动切换
+        storage = self.storage if self.response_format == "b64_json" else None
+        provider, result = await self.router.generate(
+            payload, storage, style_count=style_count, deadline=deadline
+        )
+
+        # 解析响应
+        image_data = result.get("data", [{}])[0]
+        return {
+            "image_url": image_data.get("url", ""),
+            "revised_prompt": image_data.get("revised_prompt", prompt),
+            "seed": result.get("seed") or seed,
+            "model": provider.model,
+            "provider": provider.name
+        }
 
     async def generate_image_with_retry(
         self,
         prompt: str,
         size: str = "square_medium",
         style_strength: float = 0.8,
-        max_retries: int = 3
+        seed: Optional[int] = None,
+        draft: bool = False,
+        max_retries: int = 3,
+        style_count: int = 1
     ) -> dict:
         """
         带重试机制的图片生成
 
+        截止时间按预测耗时设置：剩余时间不足以完成一次预计耗时的请求时不再重试。
+
         Args:
             prompt: 优化后的提示词
             size: 尺寸ID
             style_strength: 风格强度
+            seed: 随机种子（可选，用于复现）
+            draft: 草稿模式
             max_retries: 最大重试次数
+            style_count: 风格数（用于延迟预测）
 
         Returns:
             生成结果
         """
         last_error = None
+        width, height = self._dimensions(size, draft)
+        profile = ProviderRouter.profile({"width": width, "height": height}, style_count)
+        best = self.router.ranked()[0]
+        expected, _ = self.router.predict(best, profile)
+        deadline = time.monotonic() + min(self.retry_deadline, self.router.timeout_for(best, profile) * max_retries)
 
         for attempt in range(max_retries):
+            if attempt > 0 and deadline - time.monotonic() < expected:
+                break
             try:
-                result = await self.generate_image(
-                    prompt=prompt,
-                    size=size,
-                    style_strength=style_strength
-                )
+                with tracer.span("image.attempt", attempt=attempt + 1):
+                    result = await self.generate_image(
+                        prompt=prompt,
+                        size=size,
+                        style_strength=style_strength,
+                        seed=seed,
+                        draft=draft,
+                        style_count=style_count,
+                        deadline=deadline
+                    )
                 return result
             except httpx.HTTPStatusError as e:
                 last_error = e
@@ -118,12 +179,36 @@ class ImageService:
                 else:
                     # 客户端错误，直接抛出
                     raise
-            except httpx.TimeoutException as e:
+            except httpx.TransportError as e:
+                # 超时与连接错误（所有后端均不可用），重试
                 last_error = e
                 continue
 
         raise last_error or Exception("生成失败，已达最大重试次数")
 
-
-# 全局服务实例
-image_service = ImageService()
+    async def warm(self) -> None:
+        """预热所有后端连接池"""
+        await self.router.warm()
+
+    def provider_status(self) -> list:
+        """各生图后端的健康状态"""
+        return self.router.status()
+
+    async def aclose(self) -> None:
+        """关闭所有后端连接池"""
+        await self.router.aclose()
+
+
+def build_image_service(storage: Optional[ImageStorage] = None) -> ImageService:
+    """根据配置构建生图服务"""
+    return ImageService(
+        response_format=settings.image_response_format,
+        storage=storage,
+        latency=LatencyModel(
+            prior_base=5.0,
+            prior_per_unit=10.0,
+            max_timeout=120.0,
+            half_life=settings.latency_half_life
+        ),
+        retry_deadline=settings.image_retry_deadline
+    )
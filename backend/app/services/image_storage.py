@@ -0,0 +1,189 @@
+"""
+本地图片存储 - 支持将 b64_json 响应流式解码直接写入文件
+
+b64_json 响应体中单个字段就有数 MB，若先 response.json() 再整体解码，
+内存中会同时存在原始响应、JSON 字符串和解码结果三份副本。
+这里边读边解析：base64 负载按 4 字节对齐分块解码写盘，其余 JSON
+骨架（负载替换为空字符串）单独保留，用于读取 seed 等元信息。
+"""
+
+import base64
+import os
+import uuid
+from typing import AsyncIterator, Optional, Tuple
+
+import aiofiles
+import orjson
+
+from app.core.config import settings
+from app.services.image_dedup import ImageDedupIndex
+
+
+_B64_KEY = b'"b64_json"'
+
+# 文件头 -> 扩展名
+_MAGIC_EXTENSIONS = (
+    (b"\x89PNG", ".png"),
+    (b"\xff\xd8", ".jpg"),
+    (b"RIFF", ".webp"),
+)
+
+
+def guess_extension(head: bytes) -> str:
+    """根据文件头判断图片扩展名"""
+    for magic, extension in _MAGIC_EXTENSIONS:
+        if head.startswith(magic):
+            return extension
+    return ".png"
+
+
+class B64JsonStreamDecoder:
+    """
+    增量解析 JSON 响应中的 b64_json 字段
+
+    feed() 每次返回本块中可解码的图片字节；finish() 返回去掉负载后的 JSON 骨架。
+    只处理第一个 b64_json 字段（请求固定 n=1）。
+    """
+
+    _SEARCH, _VALUE_START, _PAYLOAD, _REST = range(4)
+
+    def __init__(self):
+        self._state = self._SEARCH
+        self._skeleton = bytearray()
+        self._carry = b""
+        self._b64_remainder = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        """输入一块响应体，返回解码出的图片字节"""
+        decoded = bytearray()
+        data = chunk
+        while data:
+            if self._state == self._SEARCH:
+                data = self._carry + data
+                index = data.find(_B64_KEY)
+                if index < 0:
+                    # 保留可能被切断的键名前缀
+                    keep = len(_B64_KEY) - 1
+                    self._skeleton += data[:-keep]
+                    self._carry = data[-keep:]
+                    return bytes(decoded)
+                end = index + len(_B64_KEY)
+                self._skeleton += data[:end]
+                self._carry = b""
+                data = data[end:]
+                self._state = self._VALUE_START
+            elif self._state == self._VALUE_START:
+                # 跳过冒号与空白，直到字符串起始引号
+                index = data.find(b'"')
+                if index < 0:
+                    self._skeleton += data
+                    return bytes(decoded)
+                self._skeleton += data[:index + 1]
+                data = data[index + 1:]
+                self._state = self._PAYLOAD
+            elif self._state == self._PAYLOAD:
+                index = data.find(b'"')
+                payload = data if index < 0 else data[:index]
+                decoded += self._decode(payload, final=index >= 0)
+                if index < 0:
+                    return bytes(decoded)
+                self._skeleton += b'"'
+                data = data[index + 1:]
+                self._state = self._REST
+            else:
+                self._skeleton += data
+                return bytes(decoded)
+        return bytes(decoded)
+
+    def _decode(self, payload: bytes, final: bool) -> bytes:
+        """按 4 字节对齐解码，剩余部分留到下一块"""
+        # JSON 可能将 "/" 转义为 "\/"
+        data = self._b64_remainder + payload.replace(b"\\", b"")
+        usable = len(data) if final else len(data) - len(data) % 4
+        self._b64_remainder = data[usable:]
+        return base64.b64decode(data[:usable]) if usable else b""
+
+    def finish(self) -> dict:
+        """结束解析，返回去掉负载后的响应 JSON"""
+        if self._state == self._SEARCH:
+            self._skeleton += self._carry
+        if self._state != self._REST:
+            raise ValueError("响应中未找到完整的 b64_json 字段")
+        return orjson.loads(bytes(self._skeleton))
+
+
+class ImageStorage:
+    """本地图片目录（通过静态文件路由对外提供访问）"""
+
+    def __init__(
+        self,
+        directory: str,
+        public_path: str,
+        public_base_url: str = "",
+        dedup: Optional[ImageDedupIndex] = None
+    ):
+        self.directory = directory
+        self.public_path = public_path.rstrip("/")
+        self.public_base_url = public_base_url.rstrip("/")
+        # 内容去重索引（为 None 时不去重）
+        self.dedup = dedup
+
+    def url_for(self, filename: str) -> str:
+        """文件的对外 URL"""
+        return f"{self.public_base_url}{self.public_path}/{filename}"
+
+    def path_for(self, filename: str) -> str:
+        """文件的本地路径"""
+        return os.path.join(self.directory, filename)
+
+    def filename_for(self, url: str) -> Optional[str]:
+        """本地存储的 URL 对应的文件名，非本地 URL 返回 None"""
+        prefix = self.url_for("")
+        if not url.startswith(prefix):
+            return None
+        return os.path.basename(url[len(prefix):]) or None
+
+    async def save_b64_stream(self, chunks: AsyncIterator[bytes]) -> Tuple[str, dict]:
+        """
+        流式解码 b64_json 响应并写入文件
+
+        Args:
+            chunks: 响应体字节流
+
+        Returns:
+            (文件名, 去掉负载后的响应 JSON)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stem = uuid.uuid4().hex
+        partial_path = self.path_for(f"{stem}.part")
+        decoder = B64JsonStreamDecoder()
+        head: Optional[bytes] = None
+        try:
+            async with aiofiles.open(partial_path, "wb") as f:
+                async for chunk in chunks:
+                    decoded = decoder.feed(chunk)
+                    if decoded:
+                        if head is None:
+                            head = decoded[:8]
+                        await f.write(decoded)
+            result = decoder.finish()
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+        filename = stem + guess_extension(head or b"")
+        os.replace(partial_path, self.path_for(filename))
+        if self.dedup is not None:
+            filename = await self.dedup.add(filename)
+        return filename, result
+
+
+def build_image_storage(dedup: Optional[ImageDedupIndex] = None) -> ImageStorage:
+    """根据配置构建本地图片存储"""
+    return ImageStorage(
+        directory=settings.image_storage_dir,
+        public_path=settings.image_public_path,
+        public_base_url=settings.image_public_base_url,
+        dedup=dedup
+    )
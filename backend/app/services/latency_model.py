@@ -0,0 +1,142 @@
+"""
+在线延迟模型 - 按 (后端, 尺寸, 风格数) 学习耗时，用于设置超时、重试截止时间和预计耗时
+
+每个键维护按时间衰减的均值与方差：久未更新的统计权重按半衰期衰减，
+后端性能变化后新的观测值会迅速取代旧值。没有观测时依次回退到同一
+后端的单位耗时（秒/百万像素）和先验值。
+"""
+
+import math
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class LatencyStats:
+    """单个键的衰减均值/方差"""
+
+    __slots__ = ("mean", "var", "weight", "updated", "samples")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.weight = 0.0
+        self.updated = 0.0
+        self.samples = 0
+
+    def decayed_weight(self, now: float, half_life: float) -> float:
+        return self.weight * 0.5 ** ((now - self.updated) / half_life)
+
+    def update(self, value: float, now: float, half_life: float, alpha: float) -> None:
+        """
+        加入一次观测
+
+        权重上限为 1/alpha，即稳定状态下等价于系数 alpha 的 EWMA；
+        长时间未更新时权重衰减到接近 0，新观测几乎完全取代旧值。
+        """
+        if self.samples == 0:
+            self.mean = value
+            # 样本不足时保守估计波动
+            self.var = (value * 0.5) ** 2
+            self.weight = 1.0
+        else:
+            self.weight = min(self.decayed_weight(now, half_life) + 1.0, 1.0 / alpha)
+            rate = 1.0 / self.weight
+            delta = value - self.mean
+            self.mean += rate * delta
+            self.var = (1 - rate) * (self.var + rate * delta * delta)
+        self.updated = now
+        self.samples += 1
+
+
+class LatencyModel:
+    """延迟预测与超时计算"""
+
+    def __init__(
+        self,
+        prior_base: float,
+        prior_per_unit: float = 0.0,
+        min_timeout: float = 5.0,
+        max_timeout: float = 120.0,
+        timeout_sigmas: float = 4.0,
+        timeout_multiplier: float = 2.0,
+        half_life: float = 1800.0,
+        alpha: float = 0.2,
+        min_weight: float = 0.25
+    ):
+        self.prior_base = prior_base
+        self.prior_per_unit = prior_per_unit
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_sigmas = timeout_sigmas
+        self.timeout_multiplier = timeout_multiplier
+        self.half_life = half_life
+        self.alpha = alpha
+        self.min_weight = min_weight
+        self._stats: Dict[Hashable, LatencyStats] = {}
+        # 分组（后端）单位耗时：秒 / 单位规模
+        self._unit_stats: Dict[Hashable, LatencyStats] = {}
+
+    def observe(self, key: Hashable, seconds: float, scale: float = 1.0, group: Hashable = None) -> None:
+        """
+        记录一次观测
+
+        Args:
+            key: 统计键，如 (后端, "1024x1024", 风格数)
+            seconds: 耗时（超时的请求以超时时长记录，作为耗时下界）
+            scale: 请求规模（生图为百万像素）
+            group: 回退分组，如后端名
+        """
+        now = time.monotonic()
+        self._stats.setdefault(key, LatencyStats()).update(seconds, now, self.half_life, self.alpha)
+        if group is not None and scale > 0:
+            self._unit_stats.setdefault(group, LatencyStats()).update(
+                seconds / scale, now, self.half_life, self.alpha
+            )
+
+    def _fresh(self, stats: Optional[LatencyStats], now: float) -> bool:
+        return stats is not None and stats.decayed_weight(now, self.half_life) >= self.min_weight
+
+    def predict(self, key: Hashable, scale: float = 1.0, group: Hashable = None) -> Tuple[float, float]:
+        """
+        预测耗时
+
+        Returns:
+            (预计耗时, 标准差)
+        """
+        now = time.monotonic()
+        stats = self._stats.get(key)
+        if self._fresh(stats, now):
+            return stats.mean, math.sqrt(stats.var)
+        unit = self._unit_stats.get(group) if group is not None else None
+        if self._fresh(unit, now):
+            return unit.mean * scale, math.sqrt(unit.var) * scale
+        mean = self.prior_base + self.prior_per_unit * scale
+        return mean, mean * 0.5
+
+    def timeout(
+        self,
+        key: Hashable,
+        scale: float = 1.0,
+        group: Hashable = None,
+        cap: Optional[float] = None
+    ) -> float:
+        """单次请求超时：预计耗时的若干倍与若干标准差中较大者，限制在上下限之间"""
+        mean, std = self.predict(key, scale, group)
+        timeout = max(mean * self.timeout_multiplier, mean + self.timeout_sigmas * std)
+        upper = self.max_timeout if cap is None else min(cap, self.max_timeout)
+        return max(self.min_timeout, min(timeout, upper))
+
+    def report(self) -> list:
+        """各键的当前统计"""
+        now = time.monotonic()
+        return [
+            {
+                "key": list(key) if isinstance(key, tuple) else key,
+                "mean": round(stats.mean, 3),
+                "std": round(math.sqrt(stats.var), 3),
+                "weight": round(stats.decayed_weight(now, self.half_life), 3),
+                "samples": stats.samples,
+                "age_seconds": round(now - stats.updated, 1)
+            }
+            for key, stats in self._stats.items()
+        ]
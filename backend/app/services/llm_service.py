@@ -2,10 +2,16 @@
 DeepSeek LLM 服务 - 提示词优化
 """
 
+import time
+
 import httpx
-from typing import Optional
+from typing import Iterable, Optional
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.tracing import tracer
 from app.core.styles import get_style_by_id, SIZE_OPTIONS
+from app.services.latency_model import LatencyModel
+from app.services.token_accounting import token_accountant
 from app.templates.prompts import (
     PROMPT_OPTIMIZER_SYSTEM,
     PROMPT_OPTIMIZER_USER,
@@ -21,9 +27,83 @@ class LLMService:
         self.api_key = settings.deepseek_api_key
         self.base_url = settings.deepseek_base_url
         self.model = "deepseek-chat"
+        # 优化提示词缓存：热门主题/风格组合直接命中，由预热任务在过期前刷新
+        self.prompt_cache = TTLCache(
+            max_size=settings.prompt_cache_size,
+            ttl=settings.prompt_cache_ttl
+        )
+        # 按 (接口, 风格数) 学习的调用耗时，用于设置超时和预计耗时
+        self.latency = LatencyModel(
+            prior_base=8.0,
+            max_timeout=settings.llm_timeout,
+            half_life=settings.latency_half_life
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """复用的连接池（首次使用时创建），单次请求超时由延迟模型决定"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=settings.llm_timeout,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            )
+        return self._client
+
+    async def warm(self) -> None:
+        """预先建立连接（TLS 握手）；连接失败时抛出 httpx.HTTPError，由调用方决定是否重试"""
+        if not self.api_key:
+            return
+        await self.client.get("/models", headers={"Authorization": f"Bearer {self.api_key}"}, timeout=5.0)
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def prompt_cache_key(
+        theme: str,
+        styles: Iterable[str],
+        size: str,
+        purpose: Optional[str] = None,
+        extra_description: Optional[str] = None
+    ) -> tuple:
+        """优化提示词的缓存键"""
+        return (theme, tuple(styles), size, purpose, extra_description)
 
-    async def _call_api(self, system_prompt: str, user_prompt: str) -> str:
-        """调用 DeepSeek API"""
+    async def _call_api(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        endpoint: str = "optimize",
+        styles: Iterable[str] = ()
+    ) -> str:
+        """
+        调用 DeepSeek API
+
+        输出上限按接口的历史输出长度自适应；若被截断则以默认上限重试一次。
+        """
+        styles = tuple(styles)
+        max_tokens = token_accountant.max_tokens(endpoint)
+        content, finish_reason = await self._request(system_prompt, user_prompt, endpoint, styles, max_tokens)
+        if finish_reason == "length" and max_tokens < token_accountant.default_max_tokens:
+            content, _ = await self._request(
+                system_prompt, user_prompt, endpoint, styles, token_accountant.default_max_tokens
+            )
+        return content
+
+    async def _request(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        endpoint: str,
+        styles: Iterable[str],
+        max_tokens: int
+    ) -> tuple:
+        """发送单次请求并记录 token 用量，返回 (内容, 结束原因)"""
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -36,18 +116,39 @@ class LLMService:
                 {"role": "user", "content": user_prompt}
             ],
             "temperature": 0.7,
-            "max_tokens": 1000
+            "max_tokens": max_tokens
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result["choices"][0]["message"]["content"].strip()
+        key = (endpoint, len(styles))
+        timeout = self.latency.timeout(key)
+        with tracer.span("llm.call", model=self.model, endpoint=endpoint, max_tokens=max_tokens) as span:
+            start = time.monotonic()
+            try:
+                response = await self.client.post(
+                    "/chat/completions",
+                    headers=headers,
+                    json=payload,
+                    timeout=timeout
+                )
+                response.raise_for_status()
+                result = response.json()
+            except httpx.TimeoutException:
+                self.latency.observe(key, timeout)
+                raise
+            self.latency.observe(key, time.monotonic() - start)
+
+            choice = result["choices"][0]
+            finish_reason = choice.get("finish_reason")
+            usage = result.get("usage")
+            token_accountant.record(endpoint, usage, finish_reason, styles)
+            if span is not None and usage:
+                span.attrs["completion_tokens"] = usage.get("completion_tokens")
+            return choice["message"]["content"].strip(), finish_reason
+
+    def estimate(self, endpoint: str, style_count: int = 1) -> float:
+        """预测一次调用的耗时（秒）"""
+        mean, _ = self.latency.predict((endpoint, style_count))
+        return mean
 
     def _format_styles(self, style_ids: list) -> str:
         """格式化风格信息"""
@@ -70,7 +171,8 @@ class LLMService:
         styles: list,
         size: str,
         purpose: Optional[str] = None,
-        extra_description: Optional[str] = None
+        extra_description: Optional[str] = None,
+        use_cache: bool = True
     ) -> str:
         """
         优化用户输入，生成精准的图像生成提示词
@@ -81,10 +183,17 @@ class LLMService:
             size: 尺寸ID
             purpose: 用途场景
             extra_description: 额外描述
+            use_cache: 是否读取缓存（为 False 时强制调用 LLM 并刷新缓存）
 
         Returns:
             优化后的英文提示词
         """
+        cache_key = self.prompt_cache_key(theme, styles, size, purpose, extra_description)
+        if use_cache:
+            cached = self.prompt_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         # 格式化用户输入
         formatted_styles = self._format_styles(styles)
         formatted_size = self._format_size(size)
@@ -100,15 +209,19 @@ class LLMService:
         # 调用 LLM
         optimized_prompt = await self._call_api(
             PROMPT_OPTIMIZER_SYSTEM,
-            user_prompt
+            user_prompt,
+            endpoint="optimize",
+            styles=styles
         )
 
+        self.prompt_cache.set(cache_key, optimized_prompt)
         return optimized_prompt
 
     async def refine_prompt(
         self,
         original_prompt: str,
-        refine_instruction: str
+        refine_instruction: str,
+        styles: Iterable[str] = ()
     ) -> str:
         """
         根据用户微调指令修改提示词
@@ -116,6 +229,7 @@ class LLMService:
         Args:
             original_prompt: 原提示词
             refine_instruction: 用户微调指令
+            styles: 原请求的风格ID（仅用于用量统计）
 
         Returns:
             修改后的提示词
@@ -127,11 +241,9 @@ class LLMService:
 
         refined_prompt = await self._call_api(
             REFINE_SYSTEM,
-            user_prompt
+            user_prompt,
+            endpoint="refine",
+            styles=styles
         )
 
         return refined_prompt
-
-
-# 全局服务实例
-llm_service = LLMService()
@@ -0,0 +1,220 @@
+"""
+调用方配额 - 滑动窗口限流 + 每日配额 + 用量统计
+
+滑动窗口采用双桶近似：只保存当前窗口与上一窗口的计数，
+估算值 = 上一窗口计数 × 剩余重叠比例 + 当前窗口计数，每次检查 O(1)。
+进程内的计数与用量统计都按最近使用顺序保存，超出上限时淘汰最久未访问的调用方（O(1)）。
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+class QuotaExceededError(Exception):
+    """超出限流或每日配额"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Counters:
+    """单个调用方的计数（紧凑结构）"""
+
+    __slots__ = ("window_index", "current", "previous", "day", "day_count")
+
+    def __init__(self):
+        self.window_index = 0
+        self.current = 0
+        self.previous = 0
+        self.day = 0
+        self.day_count = 0
+
+
+class InMemoryQuotaBackend:
+    """进程内计数后端（单实例部署）"""
+
+    def __init__(self, window: int = 60, max_users: int = 100000):
+        self.window = window
+        self.max_users = max_users
+        # 按最近访问排序：最久未访问的在最前
+        self._counters: "OrderedDict[str, _Counters]" = OrderedDict()
+
+    def _roll(self, counters: _Counters, now: float) -> None:
+        """按当前时间滚动窗口与日期"""
+        index = int(now // self.window)
+        if index != counters.window_index:
+            counters.previous = counters.current if index == counters.window_index + 1 else 0
+            counters.current = 0
+            counters.window_index = index
+        day = int(now // 86400)
+        if day != counters.day:
+            counters.day = day
+            counters.day_count = 0
+
+    async def increment(self, user: str, now: float) -> Tuple[float, int]:
+        """计数 +1，返回 (滑动窗口估算值, 当日计数)"""
+        counters = self._counters.get(user)
+        if counters is None:
+            if len(self._counters) >= self.max_users:
+                # 淘汰最久未访问的调用方
+                self._counters.popitem(last=False)
+            counters = self._counters[user] = _Counters()
+        else:
+            self._counters.move_to_end(user)
+        self._roll(counters, now)
+        counters.current += 1
+        counters.day_count += 1
+        overlap = 1 - (now % self.window) / self.window
+        return counters.previous * overlap + counters.current, counters.day_count
+
+    async def rollback(self, user: str, now: float) -> None:
+        """撤销一次计数（请求被拒绝时不占用额度）"""
+        counters = self._counters.get(user)
+        if counters is not None:
+            counters.current = max(0, counters.current - 1)
+            counters.day_count = max(0, counters.day_count - 1)
+
+    async def day_count(self, user: str, now: float) -> int:
+        """当日计数"""
+        counters = self._counters.get(user)
+        if counters is None:
+            return 0
+        self._roll(counters, now)
+        return counters.day_count
+
+
+class RedisQuotaBackend:
+    """Redis 计数后端（多实例共享配额，需安装 redis 包）"""
+
+    def __init__(self, url: str, window: int = 60, prefix: str = "quota"):
+        import redis.asyncio as redis
+
+        self.window = window
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+
+    async def increment(self, user: str, now: float) -> Tuple[float, int]:
+        index = int(now // self.window)
+        day = int(now // 86400)
+        current_key = f"{self.prefix}:{user}:w:{index}"
+        day_key = f"{self.prefix}:{user}:d:{day}"
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, self.window * 2)
+            pipe.get(f"{self.prefix}:{user}:w:{index - 1}")
+            pipe.incr(day_key)
+            pipe.expire(day_key, 86400 * 2)
+            current, _, previous, day_count, _ = await pipe.execute()
+        overlap = 1 - (now % self.window) / self.window
+        return int(previous or 0) * overlap + current, day_count
+
+    async def rollback(self, user: str, now: float) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.decr(f"{self.prefix}:{user}:w:{int(now // self.window)}")
+            pipe.decr(f"{self.prefix}:{user}:d:{int(now // 86400)}")
+            await pipe.execute()
+
+    async def day_count(self, user: str, now: float) -> int:
+        value = await self._redis.get(f"{self.prefix}:{user}:d:{int(now // 86400)}")
+        return int(value or 0)
+
+
+class QuotaService:
+    """调用方配额服务"""
+
+    def __init__(self, backend, rate_limit: int = 10, daily_quota: int = 200, max_users: int = 100000):
+        self.backend = backend
+        self.rate_limit = rate_limit
+        self.daily_quota = daily_quota
+        self.max_users = max_users
+        # 本实例的用量统计：调用方 -> {动作: 次数}，按最近访问排序
+        self._usage: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_limit > 0 or self.daily_quota > 0
+
+    async def consume(self, user: str, action: str, now: Optional[float] = None) -> None:
+        """
+        检查并消耗一次额度
+
+        Args:
+            user: 调用方标识
+            action: 动作名（generate / refine / finalize）
+
+        Raises:
+            QuotaExceededError: 超出限流或每日配额
+        """
+        usage = self._touch(user)
+        if not self.enabled:
+            usage[action] = usage.get(action, 0) + 1
+            return
+
+        now = time.time() if now is None else now
+        rate, day_count = await self.backend.increment(user, now)
+        error = None
+        if self.rate_limit > 0 and rate > self.rate_limit:
+            window = self.backend.window
+            error = QuotaExceededError(
+                f"请求过于频繁：每 {window} 秒最多 {self.rate_limit} 次",
+                retry_after=max(1, int(window - now % window))
+            )
+        elif self.daily_quota > 0 and day_count > self.daily_quota:
+            error = QuotaExceededError(
+                f"已超出每日配额：{self.daily_quota} 次",
+                retry_after=max(1, int(86400 - now % 86400))
+            )
+
+        if error is not None:
+            await self.backend.rollback(user, now)
+            usage["rejected"] = usage.get("rejected", 0) + 1
+            raise error
+        usage[action] = usage.get(action, 0) + 1
+
+    def _touch(self, user: str) -> Dict[str, int]:
+        """取调用方的用量统计并标记为最近访问，超出上限时淘汰最久未访问的"""
+        usage = self._usage.get(user)
+        if usage is None:
+            if len(self._usage) >= self.max_users:
+                self._usage.popitem(last=False)
+            usage = self._usage[user] = {}
+        else:
+            self._usage.move_to_end(user)
+        return usage
+
+    async def report(self, user: str) -> dict:
+        """单个调用方的用量报告"""
+        day_count = await self.backend.day_count(user, time.time())
+        return {
+            "user": user,
+            "usage": dict(self._usage.get(user, {})),
+            "today": day_count,
+            "daily_quota": self.daily_quota or None,
+            "remaining_today": max(0, self.daily_quota - day_count) if self.daily_quota else None,
+            "rate_limit_per_window": self.rate_limit or None,
+            "window_seconds": self.backend.window
+        }
+
+    def usage_summary(self) -> dict:
+        """所有调用方的用量（本实例）"""
+        return {user: dict(usage) for user, usage in self._usage.items()}
+
+
+def build_quota_backend():
+    """根据配置选择计数后端"""
+    if settings.quota_redis_url:
+        return RedisQuotaBackend(settings.quota_redis_url, window=settings.rate_limit_window)
+    return InMemoryQuotaBackend(window=settings.rate_limit_window)
+
+
+def build_quota_service() -> QuotaService:
+    """根据配置构建配额服务"""
+    return QuotaService(
+        backend=build_quota_backend(),
+        rate_limit=settings.rate_limit_per_window,
+        daily_quota=settings.daily_quota
+    )
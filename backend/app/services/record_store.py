@@ -0,0 +1,178 @@
+"""
+生成记录持久化 - SQLite 存储 + 写后缓冲（write-behind）
+
+请求路径只把记录放入内存缓冲即返回，后台任务按条数或时间间隔
+将缓冲区合并为一个事务批量写入，应用关闭时在 lifespan 中刷盘。
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# (generation_id, parent_id, created_at, JSON 字节)
+RecordRow = Tuple[str, Optional[str], int, bytes]
+
+
+class SQLiteRecordStore:
+    """SQLite 生成记录存储"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL 模式下读连接与写连接互不阻塞：批量写入期间请求仍可读取
+        self._read_lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "generation_id TEXT PRIMARY KEY, "
+                "parent_id TEXT, "
+                "created_at INTEGER NOT NULL, "
+                "data BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_generations_parent ON generations(parent_id)"
+            )
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+
+    def write_batch(self, rows: List[RecordRow]) -> None:
+        """在单个事务中批量写入"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO generations (generation_id, parent_id, created_at, data) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+    def get(self, generation_id: str) -> Optional[bytes]:
+        """按ID读取记录 JSON（阻塞调用，请在线程中执行）"""
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT data FROM generations WHERE generation_id = ?", (generation_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def children(self, parent_id: str) -> List[bytes]:
+        """读取某记录的所有直接子版本（阻塞调用，请在线程中执行）"""
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT data FROM generations WHERE parent_id = ? ORDER BY created_at",
+                (parent_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        with self._read_lock:
+            self._reader.close()
+        with self._lock:
+            self._conn.close()
+
+
+class WriteBehindBuffer:
+    """写后缓冲：内存确认、批量落盘"""
+
+    def __init__(self, store: SQLiteRecordStore, max_batch: int = 200, flush_interval: float = 1.0):
+        self.store = store
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending: "OrderedDict[str, RecordRow]" = OrderedDict()
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_batches = 0
+        self.flushed_records = 0
+        self.failed_flushes = 0
+
+    def add(self, row: RecordRow) -> None:
+        """加入缓冲（不做 IO），达到批量阈值时唤醒后台刷盘"""
+        self._pending[row[0]] = row
+        if len(self._pending) >= self.max_batch:
+            self._flush_requested.set()
+
+    def get(self, generation_id: str) -> Optional[bytes]:
+        """读取尚未落盘的记录（读己之写）"""
+        row = self._pending.get(generation_id)
+        return row[3] if row else None
+
+    async def flush(self) -> int:
+        """将当前缓冲作为一个事务写入存储"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, OrderedDict()
+            try:
+                await asyncio.to_thread(self.store.write_batch, list(batch.values()))
+            except Exception:
+                # 写入失败：放回缓冲等待下次重试（保留期间更新过的新版本）
+                self.failed_flushes += 1
+                logger.exception("生成记录批量写入失败，%d 条记录将重试", len(batch))
+                batch.update(self._pending)
+                self._pending = batch
+                return 0
+            self.flushed_batches += 1
+            self.flushed_records += len(batch)
+            return len(batch)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        """启动后台刷盘任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """停止后台任务并刷盘剩余记录"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushed_batches": self.flushed_batches,
+            "flushed_records": self.flushed_records,
+            "failed_flushes": self.failed_flushes
+        }
+
+
+def build_record_buffer(database_url: Optional[str]) -> Optional[WriteBehindBuffer]:
+    """
+    根据 DATABASE_URL 构建持久化缓冲
+
+    目前支持 sqlite:///path/to/file.db；未配置或其他数据库时仅使用内存存储。
+    """
+    if not database_url:
+        return None
+    if not database_url.startswith("sqlite:///"):
+        logger.warning("暂不支持的 DATABASE_URL，生成记录仅保存在内存中: %s", database_url.split("://")[0])
+        return None
+    return WriteBehindBuffer(
+        SQLiteRecordStore(database_url[len("sqlite:///"):]),
+        max_batch=settings.record_flush_batch_size,
+        flush_interval=settings.record_flush_interval
+    )
@@ -0,0 +1,217 @@
+"""
+全文检索服务 - 基于倒排索引检索历史生成记录
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+from app.core.append_log import AppendLog
+from app.core.styles import get_style_by_id
+
+
+# ASCII 单词 / 连续中日韩字符
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[\u3400-\u9fff\uf900-\ufaff]+")
+_CJK_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+
+# 英文停用词（提示词中高频但无区分度）
+_STOP_WORDS = frozenset({
+    "a", "an", "and", "the", "of", "in", "on", "with", "to", "for",
+    "by", "at", "is", "are", "all", "one", "ones",
+})
+
+# 各字段权重：主题与微调指令比长提示词更能代表用户意图
+_FIELD_WEIGHTS = {
+    "theme": 2,
+    "refine_instruction": 2,
+    "optimized_prompt": 1,
+    "style_keywords": 1,
+}
+
+# BM25 参数
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def _normalize_word(word: str) -> str:
+    """英文单词简单归一化（复数 -> 单数）"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：英文按单词切分，中文按二元组（bigram）切分
+
+    Args:
+        text: 待分词文本
+
+    Returns:
+        词项列表
+    """
+    tokens = []
+    for chunk in _TOKEN_PATTERN.findall(text.lower()):
+        if _CJK_PATTERN.match(chunk):
+            if len(chunk) == 1:
+                tokens.append(chunk)
+            else:
+                tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        elif chunk not in _STOP_WORDS:
+            tokens.append(_normalize_word(chunk))
+    return tokens
+
+
+class SearchService:
+    """生成记录全文检索服务"""
+
+    def __init__(self, index_path: Optional[str] = None):
+        # 倒排表：词项 -> {记录ID: 加权词频}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # 正排信息：记录ID -> 词频（用于重建索引时移除旧词项）
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._doc_meta: Dict[str, dict] = {}
+        self._total_length = 0
+        # 索引日志：启动时直接回放词频，无需重新分词
+        self._log = AppendLog(
+            index_path,
+            snapshot=self._snapshot,
+            live_count=lambda: len(self._doc_terms)
+        ) if index_path else None
+
+    def _collect_fields(self, record: dict) -> Dict[str, str]:
+        """提取记录中参与检索的字段"""
+        original_request = record.get("original_request") or {}
+        style_keywords = []
+        for style_id in original_request.get("styles", []):
+            style = get_style_by_id(getattr(style_id, "value", style_id))
+            if style:
+                style_keywords.extend([
+                    style["name"], style["name_en"],
+                    style["keywords_cn"], style["keywords_en"]
+                ])
+        return {
+            "theme": original_request.get("theme", ""),
+            "refine_instruction": record.get("refine_instruction") or "",
+            "optimized_prompt": record.get("optimized_prompt", ""),
+            "style_keywords": " ".join(style_keywords),
+        }
+
+    def _add_document(self, doc_id: str, terms: Dict[str, int], meta: dict) -> None:
+        """写入倒排表（已存在则先移除旧词项）"""
+        self._remove_document(doc_id)
+        for term, freq in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = freq
+        length = sum(terms.values())
+        self._doc_terms[doc_id] = terms
+        self._doc_lengths[doc_id] = length
+        self._doc_meta[doc_id] = meta
+        self._total_length += length
+
+    def _remove_document(self, doc_id: str) -> None:
+        """从倒排表中移除记录"""
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id, 0)
+        self._doc_meta.pop(doc_id, None)
+
+    def index_record(self, record: dict) -> None:
+        """
+        增量索引单条生成记录
+
+        Args:
+            record: 生成记录
+        """
+        doc_id = record["generation_id"]
+        terms: Counter = Counter()
+        for field, text in self._collect_fields(record).items():
+            weight = _FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                terms[token] += weight
+
+        original_request = record.get("original_request") or {}
+        meta = {
+            "generation_id": doc_id,
+            "image_url": record.get("image_url", ""),
+            "theme": original_request.get("theme", ""),
+            "optimized_prompt": record.get("optimized_prompt", ""),
+            "styles": [getattr(s, "value", s) for s in original_request.get("styles", [])],
+            "refine_instruction": record.get("refine_instruction"),
+            "parent_id": record.get("parent_id"),
+            "created_at": record.get("created_at"),
+        }
+        terms = dict(terms)
+        self._add_document(doc_id, terms, meta)
+        if self._log is not None:
+            self._log.append({"id": doc_id, "terms": terms, "meta": meta})
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        """
+        BM25 排序检索
+
+        Args:
+            query: 查询文本
+            limit: 最大返回条数
+
+        Returns:
+            按相关度降序排列的记录摘要
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms or not self._doc_lengths:
+            return []
+
+        doc_count = len(self._doc_lengths)
+        avg_length = self._total_length / doc_count
+        scores: Dict[str, float] = {}
+
+        for term in query_terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, freq in postings.items():
+                norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * self._doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (_BM25_K1 + 1) / (freq + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {**self._doc_meta[doc_id], "score": round(score, 4)}
+            for doc_id, score in ranked
+        ]
+
+    # ============ 持久化 ============
+
+    def _snapshot(self) -> List[dict]:
+        """当前全部记录的日志条目（压缩日志时使用）"""
+        return [
+            {"id": doc_id, "terms": terms, "meta": self._doc_meta[doc_id]}
+            for doc_id, terms in self._doc_terms.items()
+        ]
+
+    def load(self) -> None:
+        """从索引日志恢复倒排表（启动时在线程中调用，完成前不处理请求）"""
+        if self._log is None:
+            return
+        for entry in self._log.replay():
+            self._add_document(entry["id"], entry["terms"], entry["meta"])
+
+    def start(self) -> None:
+        """启动索引日志的后台写入"""
+        if self._log is not None:
+            self._log.start()
+
+    async def stop(self) -> None:
+        """写入剩余的索引日志"""
+        if self._log is not None:
+            await self._log.stop()
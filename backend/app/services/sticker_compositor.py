@@ -0,0 +1,191 @@
+"""
+贴纸合成 - 在进程池中执行的纯函数（裁边、白色描边、拼图、打包）
+
+本模块只依赖 Pillow 与标准库，由贴纸包服务按需导入并提交给进程池，
+避免 CPU 密集的图像处理阻塞事件循环：每张贴纸单独作为一个任务
+（render_sticker），全部完成后再用一个任务拼图打包（assemble_pack）。
+"""
+
+import io
+import math
+import zipfile
+from typing import List, Optional, Sequence, Tuple, Union
+
+import orjson
+from PIL import Image, ImageChops, ImageFilter
+
+# 图片来源：本地文件路径或已下载的字节
+ImageSource = Union[str, bytes]
+
+# 与背景色差异小于该值的像素视为背景
+_BACKGROUND_THRESHOLD = 24
+
+# 描边膨胀在缩小的蒙版上进行，缩小后膨胀半径不超过该值
+_DILATE_RADIUS = 6
+
+
+def _open(source: ImageSource) -> "Image.Image":
+    image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    return image.convert("RGBA")
+
+
+def _subject_mask(image: "Image.Image") -> "Image.Image":
+    """
+    主体蒙版：有透明通道时直接使用，否则以左上角像素为背景色抠除近似纯色背景
+    """
+    alpha = image.getchannel("A")
+    if alpha.getextrema()[0] < 255:
+        return alpha
+    rgb = image.convert("RGB")
+    background = Image.new("RGB", rgb.size, rgb.getpixel((0, 0)))
+    diff = ImageChops.difference(rgb, background).convert("L")
+    return diff.point(lambda value: 255 if value > _BACKGROUND_THRESHOLD else 0)
+
+
+def _dilate(mask: "Image.Image", radius: int) -> "Image.Image":
+    """
+    蒙版外扩 radius 像素
+
+    大核 MaxFilter 的开销随核面积增长，这里先把蒙版按块缩小（块内任一像素
+    属于主体即整块属于主体），在小图上用小核膨胀后再双线性放大回原尺寸，
+    放大得到的过渡边缘正好作为描边的抗锯齿。
+    """
+    factor = max(1, math.ceil(radius / _DILATE_RADIUS))
+    if factor == 1:
+        return mask.filter(ImageFilter.MaxFilter(radius * 2 + 1))
+    # 尺寸补齐到 factor 的整数倍，块与原图像素一一对应
+    width, height = math.ceil(mask.width / factor) * factor, math.ceil(mask.height / factor) * factor
+    padded = Image.new("L", (width, height), 0)
+    padded.paste(mask, (0, 0))
+    small = padded.reduce(factor).point(lambda value: 255 if value > 0 else 0)
+    # 块粒度的膨胀多扩一格，保证放大后描边不窄于 radius
+    small = small.filter(ImageFilter.MaxFilter((math.ceil(radius / factor) + 1) * 2 + 1))
+    return small.resize((width, height), Image.BILINEAR).crop((0, 0, mask.width, mask.height))
+
+
+def make_sticker(source: ImageSource, outline: int = 8) -> "Image.Image":
+    """
+    生成单张贴纸：去背景、裁掉空白边并加白色描边
+
+    Args:
+        source: 图片来源
+        outline: 描边宽度（像素），0 表示不描边
+
+    Returns:
+        RGBA 贴纸图
+    """
+    image = _open(source)
+    mask = _subject_mask(image)
+    bbox = mask.getbbox() or (0, 0, image.width, image.height)
+    image = image.crop(bbox)
+    mask = mask.crop(bbox)
+
+    if outline > 0:
+        # 四周留出描边空间
+        size = (image.width + outline * 2, image.height + outline * 2)
+        padded = Image.new("L", size, 0)
+        padded.paste(mask, (outline, outline))
+        outline_mask = _dilate(padded, outline)
+        sticker = Image.new("RGBA", size, (255, 255, 255, 0))
+        sticker.paste((255, 255, 255, 255), (0, 0), outline_mask)
+        sticker.paste(image, (outline, outline), mask)
+        return sticker
+
+    image.putalpha(mask)
+    return image
+
+
+def _fit(image: "Image.Image", cell_size: int) -> "Image.Image":
+    """等比缩放到单元格内"""
+    scale = min(cell_size / image.width, cell_size / image.height, 1.0)
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def _png_bytes(image: "Image.Image") -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def render_sticker(source: ImageSource, outline: int = 8, cell_size: int = 256) -> Tuple[bytes, tuple, bytes]:
+    """
+    生成单张贴纸及其拼图缩略图（每张贴纸一个进程池任务）
+
+    Args:
+        source: 图片来源
+        outline: 描边宽度
+        cell_size: 拼图单元格边长
+
+    Returns:
+        (贴纸 PNG 字节, 贴纸尺寸, 缩略图 PNG 字节)
+    """
+    sticker = make_sticker(source, outline=outline)
+    return _png_bytes(sticker), sticker.size, _png_bytes(_fit(sticker, cell_size))
+
+
+def assemble_pack(
+    stickers: Sequence[Tuple[str, bytes, tuple, bytes]],
+    columns: Optional[int] = None,
+    cell_size: int = 256,
+    padding: int = 16
+) -> bytes:
+    """
+    拼图并打包
+
+    Args:
+        stickers: (生成记录ID, 贴纸 PNG, 贴纸尺寸, 缩略图 PNG) 列表，顺序即拼图顺序
+        columns: 拼图列数，默认取接近正方形的列数
+        cell_size: 拼图单元格边长
+        padding: 单元格间距
+
+    Returns:
+        zip 字节：stickers/<id>.png（原分辨率贴纸）、sheet.png（拼图）、index.json（索引）
+    """
+    columns = columns or math.ceil(math.sqrt(len(stickers)))
+    rows = math.ceil(len(stickers) / columns)
+    sheet_size = (
+        columns * cell_size + (columns + 1) * padding,
+        rows * cell_size + (rows + 1) * padding
+    )
+    sheet = Image.new("RGBA", sheet_size, (0, 0, 0, 0))
+
+    index: List[dict] = []
+    buffer = io.BytesIO()
+    # PNG 本身已压缩，zip 内直接存储
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for position, (generation_id, sticker_png, (width, height), thumb_png) in enumerate(stickers):
+            filename = f"stickers/{generation_id}.png"
+            archive.writestr(filename, sticker_png)
+
+            thumb = Image.open(io.BytesIO(thumb_png))
+            row, column = divmod(position, columns)
+            # 在单元格内居中
+            x = padding + column * (cell_size + padding) + (cell_size - thumb.width) // 2
+            y = padding + row * (cell_size + padding) + (cell_size - thumb.height) // 2
+            sheet.paste(thumb, (x, y), thumb)
+
+            index.append({
+                "generation_id": generation_id,
+                "file": filename,
+                "width": width,
+                "height": height,
+                "sheet": {"x": x, "y": y, "width": thumb.width, "height": thumb.height}
+            })
+
+        archive.writestr("sheet.png", _png_bytes(sheet))
+        archive.writestr("index.json", orjson.dumps({
+            "sheet": {
+                "file": "sheet.png",
+                "width": sheet.width,
+                "height": sheet.height,
+                "columns": columns,
+                "rows": rows,
+                "cell_size": cell_size
+            },
+            "stickers": index
+        }, option=orjson.OPT_INDENT_2))
+
+    return buffer.getvalue()
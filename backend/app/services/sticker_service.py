@@ -0,0 +1,107 @@
+"""
+贴纸包服务 - 将多条生成记录合成为一个贴纸包（单张贴纸 + 拼图 + JSON 索引）
+
+图片并发获取（本地存储的图片直接传文件路径给工作进程，避免在进程间复制），
+每张贴纸的裁边与描边各自作为一个进程池任务（多核并行，也不会让一个大包独占
+工作进程），最后一个任务负责拼图与打包，均不占用事件循环。
+"""
+
+import asyncio
+import os
+from typing import List, Optional, Tuple
+
+import httpx
+
+from app.core.tracing import tracer
+from app.core.workers import run_in_process
+from app.services.generation_service import GenerationService
+from app.services.image_storage import ImageStorage
+
+
+class StickerPackService:
+    """贴纸包合成服务"""
+
+    def __init__(
+        self,
+        storage: ImageStorage,
+        generations: GenerationService,
+        fetch_concurrency: int = 8,
+        fetch_timeout: float = 30.0
+    ):
+        self.storage = storage
+        self.generations = generations
+        self.fetch_timeout = fetch_timeout
+        self._fetch_semaphore = asyncio.Semaphore(fetch_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """下载图片用的共享连接池（首次使用时创建）"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.fetch_timeout, follow_redirects=True)
+        return self._client
+
+    def _local_path(self, image_url: str) -> Optional[str]:
+        """本地存储的图片返回文件路径"""
+        filename = self.storage.filename_for(image_url)
+        if filename is None:
+            return None
+        path = self.storage.path_for(filename)
+        return path if os.path.exists(path) else None
+
+    async def _fetch(self, image_url: str):
+        """获取图片：本地文件返回路径，远程图片返回字节"""
+        local_path = self._local_path(image_url)
+        if local_path is not None:
+            return local_path
+        async with self._fetch_semaphore:
+            response = await self.client.get(image_url)
+            response.raise_for_status()
+            return response.content
+
+    async def build_pack(
+        self,
+        generation_ids: List[str],
+        columns: Optional[int] = None,
+        cell_size: int = 256,
+        outline: int = 8
+    ) -> bytes:
+        """
+        合成贴纸包
+
+        Args:
+            generation_ids: 生成记录ID列表（重复ID只保留一次）
+            columns: 拼图列数
+            cell_size: 拼图单元格边长
+            outline: 白色描边宽度
+
+        Returns:
+            zip 字节
+        """
+        # 延迟导入：Pillow 只在实际合成时加载
+        from app.services.sticker_compositor import assemble_pack, render_sticker
+
+        generation_ids = list(dict.fromkeys(generation_ids))
+        urls: List[Tuple[str, str]] = []
+        for generation_id in generation_ids:
+            record = await self.generations.get_generation(generation_id)
+            if not record:
+                raise ValueError(f"未找到生成记录: {generation_id}")
+            urls.append((generation_id, record["image_url"]))
+
+        with tracer.span("sticker.fetch", count=len(urls)):
+            sources = await asyncio.gather(*(self._fetch(url) for _, url in urls))
+
+        with tracer.span("sticker.render", count=len(sources)):
+            rendered = await asyncio.gather(*(
+                run_in_process(render_sticker, source, outline, cell_size) for source in sources
+            ))
+        stickers = [(generation_id, *result) for (generation_id, _), result in zip(urls, rendered)]
+        with tracer.span("sticker.compose", count=len(stickers)):
+            return await run_in_process(assemble_pack, stickers, columns, cell_size, 16)
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
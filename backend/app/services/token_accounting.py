@@ -0,0 +1,136 @@
+"""
+LLM Token 统计 - 记录每次调用的 usage，并根据输出长度分布自适应 max_tokens
+"""
+
+import math
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+from app.core.config import settings
+
+
+class TokenUsage:
+    """Token 用量累计"""
+
+    __slots__ = ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "truncated")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.truncated = 0
+
+    def add(self, prompt: int, completion: int, cached: int, truncated: bool) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        self.cached_tokens += cached
+        self.truncated += int(truncated)
+
+    def to_dict(self) -> dict:
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "truncated": self.truncated,
+            "avg_prompt_tokens": round(self.prompt_tokens / calls, 1),
+            "avg_completion_tokens": round(self.completion_tokens / calls, 1)
+        }
+
+
+def _cached_tokens(usage: dict) -> int:
+    """提取缓存命中的 prompt token（兼容 DeepSeek 与 OpenAI 字段）"""
+    if "prompt_cache_hit_tokens" in usage:
+        return usage["prompt_cache_hit_tokens"] or 0
+    details = usage.get("prompt_tokens_details") or {}
+    return details.get("cached_tokens") or 0
+
+
+class TokenAccountant:
+    """按接口/风格聚合 token 用量，并给出自适应输出上限"""
+
+    def __init__(
+        self,
+        default_max_tokens: int = 1000,
+        min_max_tokens: int = 150,
+        headroom: float = 1.3,
+        window: int = 500,
+        min_samples: int = 50
+    ):
+        self.default_max_tokens = default_max_tokens
+        self.min_max_tokens = min_max_tokens
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self._window = window
+        self._by_endpoint: Dict[str, TokenUsage] = {}
+        self._by_style: Dict[str, TokenUsage] = {}
+        # 各接口最近的输出 token 数
+        self._completion_samples: Dict[str, deque] = {}
+
+    def record(
+        self,
+        endpoint: str,
+        usage: Optional[dict],
+        finish_reason: Optional[str] = None,
+        styles: Iterable[str] = ()
+    ) -> None:
+        """
+        记录一次调用的用量
+
+        Args:
+            endpoint: 接口名（optimize / refine）
+            usage: 响应中的 usage 字段
+            finish_reason: 结束原因，"length" 表示被 max_tokens 截断
+            styles: 本次请求涉及的风格ID
+        """
+        if not usage:
+            return
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        cached = _cached_tokens(usage)
+        truncated = finish_reason == "length"
+
+        self._by_endpoint.setdefault(endpoint, TokenUsage()).add(prompt, completion, cached, truncated)
+        for style in styles:
+            self._by_style.setdefault(style, TokenUsage()).add(prompt, completion, cached, truncated)
+
+        samples = self._completion_samples.setdefault(endpoint, deque(maxlen=self._window))
+        if truncated:
+            # 截断样本说明上限偏低，清空分布，回到默认上限重新学习
+            samples.clear()
+        else:
+            samples.append(completion)
+
+    def max_tokens(self, endpoint: str) -> int:
+        """
+        自适应输出上限：最近输出长度 P99 乘以余量
+
+        样本不足时使用默认上限。
+        """
+        samples = self._completion_samples.get(endpoint)
+        if not samples or len(samples) < self.min_samples:
+            return self.default_max_tokens
+        ordered = sorted(samples)
+        p99 = ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.99) - 1)]
+        cap = int(p99 * self.headroom)
+        return max(self.min_max_tokens, min(self.default_max_tokens, cap))
+
+    def report(self) -> dict:
+        """用量报表"""
+        return {
+            "by_endpoint": {
+                endpoint: {**usage.to_dict(), "max_tokens": self.max_tokens(endpoint)}
+                for endpoint, usage in self._by_endpoint.items()
+            },
+            "by_style": {style: usage.to_dict() for style, usage in self._by_style.items()}
+        }
+
+
+# 全局统计实例
+token_accountant = TokenAccountant(
+    default_max_tokens=settings.llm_max_tokens,
+    min_max_tokens=settings.llm_min_max_tokens
+)
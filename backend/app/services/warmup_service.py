@@ -0,0 +1,258 @@
+"""
+缓存预热服务 - 从请求历史学习热门 (主题, 风格, 尺寸) 组合，
+在低峰时段预计算优化提示词（可选预渲染图片），并在缓存过期前刷新
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.image_service import ImageService
+from app.services.llm_service import LLMService
+
+
+logger = logging.getLogger(__name__)
+
+# (主题, 风格元组, 尺寸ID, 用途, 风格强度)
+ComboKey = Tuple[str, Tuple[str, ...], str, Optional[str], float]
+
+
+class WarmupService:
+    """热门组合预热调度器"""
+
+    def __init__(
+        self,
+        llm: LLMService,
+        images: ImageService,
+        top_n: int = 300,
+        interval: float = 60.0,
+        offpeak_hours: Optional[List[int]] = None,
+        budget_per_hour: int = 200,
+        refresh_margin: float = 1800.0,
+        include_images: bool = False,
+        decay_interval: float = 3600.0
+    ):
+        self.llm = llm
+        self.images = images
+        self.top_n = top_n
+        self.interval = interval
+        self.offpeak_hours = set(offpeak_hours or [])
+        self.budget_per_hour = budget_per_hour
+        self.refresh_margin = refresh_margin
+        self.include_images = include_images
+        self.decay_interval = decay_interval
+
+        # 组合热度（定期衰减，近期请求权重更高）
+        self._popularity: Dict[ComboKey, float] = {}
+        self._last_decay = time.monotonic()
+        # 最近一小时内的上游调用时间戳
+        self._upstream_calls: deque = deque()
+        # 预渲染图片库存：组合 -> 图片及其提示词，每张只发放一次
+        # （按组合而非提示词索引：提示词刷新后已渲染的图片仍可发放，记录使用图片自身的提示词）
+        self.image_inventory = TTLCache(
+            max_size=top_n,
+            ttl=settings.prompt_cache_ttl
+        )
+        self._task: Optional[asyncio.Task] = None
+        self.warmed_prompts = 0
+        self.warmed_images = 0
+
+    # ============ 请求历史 ============
+
+    def record_request(
+        self,
+        theme: str,
+        styles: List[str],
+        size: str,
+        purpose: Optional[str],
+        extra_description: Optional[str],
+        style_strength: float
+    ) -> None:
+        """记录一次生成请求（带自由描述的长尾请求不参与预热）"""
+        if extra_description:
+            return
+        key = (theme, tuple(styles), size, purpose, style_strength)
+        self._popularity[key] = self._popularity.get(key, 0.0) + 1.0
+        if len(self._popularity) > self.top_n * 20:
+            self._prune(self.top_n * 10)
+
+    def _decay(self) -> None:
+        """热度减半衰减，并丢弃已冷却的组合"""
+        now = time.monotonic()
+        if now - self._last_decay < self.decay_interval:
+            return
+        self._last_decay = now
+        self._popularity = {
+            key: score / 2 for key, score in self._popularity.items() if score / 2 >= 0.1
+        }
+
+    def _prune(self, keep: int) -> None:
+        """只保留热度最高的若干组合"""
+        self._popularity = dict(self.popular(keep))
+
+    def popular(self, limit: Optional[int] = None) -> List[Tuple[ComboKey, float]]:
+        """按热度降序的组合"""
+        ranked = sorted(self._popularity.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit or self.top_n]
+
+    # ============ 预算与时段 ============
+
+    def is_offpeak(self, now: Optional[datetime] = None) -> bool:
+        """当前是否处于低峰时段"""
+        return (now or datetime.now()).hour in self.offpeak_hours
+
+    def budget_remaining(self) -> int:
+        """最近一小时内剩余的上游调用预算"""
+        cutoff = time.monotonic() - 3600
+        while self._upstream_calls and self._upstream_calls[0] < cutoff:
+            self._upstream_calls.popleft()
+        return max(0, self.budget_per_hour - len(self._upstream_calls))
+
+    def _spend(self) -> None:
+        self._upstream_calls.append(time.monotonic())
+
+    # ============ 预渲染图片 ============
+
+    def take_image(
+        self,
+        theme: str,
+        styles: List[str],
+        size: str,
+        purpose: Optional[str],
+        extra_description: Optional[str],
+        style_strength: float
+    ) -> Optional[dict]:
+        """
+        取出一张预渲染图片（取出后由下一轮预热补货）
+
+        Returns:
+            {"prompt": 生成该图片的提示词, "result": 生图结果}，无库存时为 None
+        """
+        if not self.include_images or extra_description:
+            return None
+        return self.image_inventory.pop((theme, tuple(styles), size, purpose, style_strength))
+
+    # ============ 预热调度 ============
+
+    async def run_once(self) -> int:
+        """
+        执行一轮预热
+
+        - 即将过期的热门提示词：任何时段都刷新，保证高峰期命中
+        - 未缓存的热门提示词与预渲染图片：仅在低峰时段预计算
+
+        Returns:
+            本轮消耗的上游调用次数
+        """
+        self._decay()
+        offpeak = self.is_offpeak()
+        spent = 0
+
+        for combo, _ in self.popular():
+            theme, styles, size, purpose, style_strength = combo
+            if self.budget_remaining() <= 0:
+                break
+
+            cache_key = self.llm.prompt_cache_key(theme, styles, size, purpose)
+            remaining = self.llm.prompt_cache.ttl_remaining(cache_key)
+            needs_prompt = (
+                remaining is None and offpeak
+            ) or (
+                remaining is not None and remaining < self.refresh_margin
+            )
+
+            try:
+                if needs_prompt:
+                    self._spend()
+                    spent += 1
+                    await self.llm.optimize_prompt(
+                        theme=theme,
+                        styles=list(styles),
+                        size=size,
+                        purpose=purpose,
+                        use_cache=False
+                    )
+                    self.warmed_prompts += 1
+
+                prompt = self.llm.prompt_cache.peek(cache_key)
+                if (self.include_images and offpeak and prompt
+                        and combo not in self.image_inventory
+                        and self.budget_remaining() > 0):
+                    self._spend()
+                    spent += 1
+                    result = await self.images.generate_image_with_retry(
+                        prompt=prompt,
+                        size=size,
+                        style_strength=style_strength
+                    )
+                    self.image_inventory.set(combo, {"prompt": prompt, "result": result})
+                    self.warmed_images += 1
+            except Exception:
+                logger.exception("预热失败: %s %s %s", theme, styles, size)
+
+        return spent
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+
+    def start(self) -> None:
+        """启动后台预热任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """停止后台预热任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def report(self) -> dict:
+        """预热状态"""
+        return {
+            "running": self._task is not None,
+            "offpeak": self.is_offpeak(),
+            "budget_remaining": self.budget_remaining(),
+            "tracked_combos": len(self._popularity),
+            "warmed_prompts": self.warmed_prompts,
+            "warmed_images": self.warmed_images,
+            "prompt_cache": self.llm.prompt_cache.stats(),
+            "image_inventory": self.image_inventory.stats(),
+            "top_combos": [
+                {
+                    "theme": theme,
+                    "styles": list(styles),
+                    "size": size,
+                    "purpose": purpose,
+                    "score": round(score, 2),
+                    "prompt_ttl": self.llm.prompt_cache.ttl_remaining(
+                        self.llm.prompt_cache_key(theme, styles, size, purpose)
+                    )
+                }
+                for (theme, styles, size, purpose, _), score in self.popular(20)
+            ]
+        }
+
+
+def build_warmup_service(llm: LLMService, images: ImageService) -> WarmupService:
+    """根据配置构建预热服务"""
+    return WarmupService(
+        llm=llm,
+        images=images,
+        top_n=settings.warmup_top_n,
+        interval=settings.warmup_interval,
+        offpeak_hours=settings.warmup_offpeak_hours,
+        budget_per_hour=settings.warmup_budget_per_hour,
+        refresh_margin=settings.warmup_refresh_margin,
+        include_images=settings.warmup_include_images
+    )
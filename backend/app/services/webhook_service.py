@@ -0,0 +1,440 @@
+"""
+Webhook 回调投递 - 签名、按目标地址合并批量发送、失败退避重试（持久化发件箱）
+
+完成事件先进入按目标地址分组的内存队列，短时间窗口内同一地址的事件合并为一次
+POST；投递失败的批次写入 SQLite 发件箱，后台任务按指数退避重试，超过最大次数后
+标记为死信。请求体签名：HMAC-SHA256(secret, "<时间戳>.<请求体>")，未配置密钥时不启用回调。
+
+回调地址在受理和每次投递前解析 DNS，解析到内网、回环、链路本地等非公网地址时拒绝
+（防止借回调访问内部服务）；可用主机白名单进一步限制。
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import orjson
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# (行ID, 目标地址, 事件列表 JSON, 首个事件时间, 已尝试次数)
+OutboxRow = Tuple[int, str, bytes, float, int]
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """计算请求签名（接收方用同样方式校验）"""
+    digest = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_destination(
+    url: str,
+    allowed_hosts: Sequence[str] = (),
+    allow_private: bool = False
+) -> Optional[str]:
+    """
+    校验回调地址
+
+    Args:
+        url: 回调地址
+        allowed_hosts: 主机白名单（含子域名），为空表示不限制
+        allow_private: 是否允许解析到非公网地址（仅用于本地测试）
+
+    Returns:
+        不允许时返回原因，允许时返回 None
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        return "回调地址必须是 http(s) 地址"
+    if allowed_hosts and not any(host == h or host.endswith("." + h) for h in allowed_hosts):
+        return f"回调主机不在白名单中: {host}"
+    if allow_private:
+        return None
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except socket.gaierror:
+        return f"无法解析回调主机: {host}"
+    if not all(_is_public(info[4][0]) for info in infos):
+        return f"回调地址不能指向内网或本机: {host}"
+    return None
+
+
+class SQLiteOutbox:
+    """待重试批次的持久化发件箱"""
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "url TEXT NOT NULL, "
+                "events BLOB NOT NULL, "
+                "enqueued_at REAL NOT NULL, "
+                "attempts INTEGER NOT NULL, "
+                "next_attempt REAL NOT NULL, "
+                "dead INTEGER NOT NULL DEFAULT 0, "
+                "last_error TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_due ON webhook_outbox(dead, next_attempt)"
+            )
+
+    def add(
+        self,
+        url: str,
+        events: bytes,
+        enqueued_at: float,
+        attempts: int,
+        next_attempt: float,
+        error: str,
+        dead: bool = False
+    ) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO webhook_outbox (url, events, enqueued_at, attempts, next_attempt, last_error, dead) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, events, enqueued_at, attempts, next_attempt, error, int(dead))
+            )
+
+    def due(self, now: float, limit: int = 100) -> List[OutboxRow]:
+        """到期待重试的批次"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, url, events, enqueued_at, attempts FROM webhook_outbox "
+                "WHERE dead = 0 AND next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (now, limit)
+            ).fetchall()
+
+    def delete(self, row_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM webhook_outbox WHERE id = ?", (row_id,))
+
+    def reschedule(self, row_id: int, attempts: int, next_attempt: float, error: str, dead: bool) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE webhook_outbox SET attempts = ?, next_attempt = ?, last_error = ?, dead = ? WHERE id = ?",
+                (attempts, next_attempt, error, int(dead), row_id)
+            )
+
+    def counts(self) -> dict:
+        with self._lock:
+            pending, dead = self._conn.execute(
+                "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM webhook_outbox"
+            ).fetchone()
+        return {"retrying": pending, "dead": dead}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class WebhookService:
+    """Webhook 投递服务"""
+
+    def __init__(
+        self,
+        outbox: SQLiteOutbox,
+        secret: str = "",
+        batch_window: float = 0.5,
+        max_batch: int = 50,
+        timeout: float = 10.0,
+        max_attempts: int = 8,
+        base_backoff: float = 2.0,
+        max_backoff: float = 600.0,
+        retry_interval: float = 1.0,
+        retry_concurrency: int = 16,
+        allowed_hosts: Sequence[str] = (),
+        allow_private: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.outbox = outbox
+        self.secret = secret
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retry_interval = retry_interval
+        self.allowed_hosts = tuple(h.lower() for h in allowed_hosts)
+        self.allow_private = allow_private
+        # 重试并发上限：个别目标超时不拖慢其他批次的重试
+        self._retry_semaphore = asyncio.Semaphore(retry_concurrency)
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # 目标地址 -> [(事件, 入队时间)]
+        self._queues: Dict[str, List[Tuple[dict, float]]] = {}
+        # 目标地址 -> 等待合并窗口结束的发送任务
+        self._flushers: Dict[str, asyncio.Task] = {}
+        # 所有未完成的发送任务（关闭时等待）
+        self._tasks: Set[asyncio.Task] = set()
+        self._retry_task: Optional[asyncio.Task] = None
+
+        # 投递指标
+        self.delivered_events = 0
+        self.delivered_batches = 0
+        self.failed_attempts = 0
+        self.dead_batches = 0
+        self._lags: deque = deque(maxlen=1000)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """复用的连接池（首次使用时创建）"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+                transport=self._transport
+            )
+        return self._client
+
+    @property
+    def enabled(self) -> bool:
+        """未配置签名密钥时不接受回调（接收方无法校验请求来源）"""
+        return bool(self.secret)
+
+    async def check_destination(self, url: str) -> Optional[str]:
+        """校验回调地址，不允许时返回原因"""
+        return await check_destination(url, self.allowed_hosts, self.allow_private)
+
+    # ============ 入队与合并 ============
+
+    def enqueue(self, url: str, event_type: str, data: dict) -> str:
+        """
+        加入一条待投递事件
+
+        Args:
+            url: 回调地址
+            event_type: 事件类型，如 generation.completed
+            data: 事件数据
+
+        Returns:
+            事件ID
+        """
+        event_id = f"evt_{uuid.uuid4().hex[:16]}"
+        event = {"id": event_id, "type": event_type, "created_at": int(time.time()), "data": data}
+        queue = self._queues.setdefault(url, [])
+        queue.append((event, time.monotonic()))
+        if len(queue) >= self.max_batch:
+            self._start_flush(url, delay=0.0)
+        elif url not in self._flushers:
+            self._start_flush(url, delay=self.batch_window)
+        return event_id
+
+    def _start_flush(self, url: str, delay: float) -> None:
+        task = self._flushers.get(url)
+        if task is not None and delay > 0:
+            return
+        if task is not None:
+            task.cancel()
+        task = asyncio.create_task(self._flush_after(url, delay))
+        self._flushers[url] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_after(self, url: str, delay: float) -> None:
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._flushers.pop(url, None)
+        await self._flush(url)
+
+    async def _flush(self, url: str) -> None:
+        """发送某地址当前排队的全部事件"""
+        queue = self._queues.pop(url, None)
+        while queue:
+            batch, queue = queue[:self.max_batch], queue[self.max_batch:]
+            events = [event for event, _ in batch]
+            enqueued_at = min(at for _, at in batch)
+            body = orjson.dumps({"events": events})
+            rejected = await self.check_destination(url)
+            if rejected is not None:
+                # 地址在受理后变为不允许（如 DNS 改指内网）：直接转入死信，不再重试
+                self.dead_batches += 1
+                logger.warning("Webhook 回调地址被拒绝，已转入死信: %s (%s)", url, rejected)
+                await self._to_outbox(url, body, enqueued_at, attempts=1, error=rejected, dead=True)
+                continue
+            error = await self._deliver(url, body, enqueued_at, len(events))
+            if error is not None:
+                await self._to_outbox(url, body, enqueued_at, attempts=1, error=error)
+
+    # ============ 发送 ============
+
+    def _headers(self, body: bytes) -> dict:
+        timestamp = str(int(time.time()))
+        return {
+            "Content-Type": "application/json",
+            "X-Webhook-Id": f"dlv_{uuid.uuid4().hex[:16]}",
+            "X-Webhook-Timestamp": timestamp,
+            "X-Webhook-Signature": sign_payload(self.secret, timestamp, body)
+        }
+
+    async def _deliver(self, url: str, body: bytes, enqueued_at: float, count: int) -> Optional[str]:
+        """发送一个批次，成功返回 None，失败返回错误描述"""
+        try:
+            response = await self.client.post(url, content=body, headers=self._headers(body))
+            response.raise_for_status()
+        except Exception as e:
+            self.failed_attempts += 1
+            return f"{type(e).__name__}: {e}"[:500]
+        self.delivered_batches += 1
+        self.delivered_events += count
+        self._lags.append(time.monotonic() - enqueued_at)
+        return None
+
+    def _backoff(self, attempts: int) -> float:
+        """指数退避（带抖动）"""
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _to_outbox(
+        self,
+        url: str,
+        body: bytes,
+        enqueued_at: float,
+        attempts: int,
+        error: str,
+        dead: bool = False
+    ) -> None:
+        # 发件箱记录墙钟时间，重启后仍可计算投递延迟
+        wall_enqueued = time.time() - (time.monotonic() - enqueued_at)
+        await asyncio.to_thread(
+            self.outbox.add, url, body, wall_enqueued, attempts, time.time() + self._backoff(attempts), error, dead
+        )
+
+    async def _retry_row(self, row: OutboxRow) -> bool:
+        """重试发件箱中的一个批次，成功返回 True"""
+        row_id, url, body, wall_enqueued, attempts = row
+        async with self._retry_semaphore:
+            enqueued_at = time.monotonic() - (time.time() - wall_enqueued)
+            error = await self.check_destination(url)
+            dead = error is not None
+            if not dead:
+                count = len(orjson.loads(body)["events"])
+                error = await self._deliver(url, body, enqueued_at, count)
+                if error is None:
+                    await asyncio.to_thread(self.outbox.delete, row_id)
+                    return True
+        attempts += 1
+        dead = dead or attempts >= self.max_attempts
+        if dead:
+            self.dead_batches += 1
+            logger.warning("Webhook 投递失败，已转入死信: %s (%s)", url, error)
+        await asyncio.to_thread(
+            self.outbox.reschedule, row_id, attempts, time.time() + self._backoff(attempts), error, dead
+        )
+        return False
+
+    async def retry_due(self) -> int:
+        """并发重试发件箱中到期的批次，返回成功数"""
+        rows = await asyncio.to_thread(self.outbox.due, time.time())
+        results = await asyncio.gather(*(self._retry_row(row) for row in rows))
+        return sum(results)
+
+    async def _retry_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            try:
+                await self.retry_due()
+            except Exception:
+                logger.exception("Webhook 重试失败")
+
+    # ============ 生命周期 ============
+
+    def start(self) -> None:
+        """启动发件箱重试任务"""
+        if self._retry_task is None:
+            self._retry_task = asyncio.create_task(self._retry_loop())
+
+    async def stop(self) -> None:
+        """停止重试任务，立即发送仍在合并窗口中的事件（失败的进入发件箱）"""
+        if self._retry_task is not None:
+            self._retry_task.cancel()
+            try:
+                await self._retry_task
+            except asyncio.CancelledError:
+                pass
+            self._retry_task = None
+        # 仍在等待合并窗口的任务取消后直接发送；已在发送中的任务等待其完成
+        for task in list(self._flushers.values()):
+            task.cancel()
+        self._flushers.clear()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for url in list(self._queues):
+            await self._flush(url)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ============ 指标 ============
+
+    def stats(self) -> dict:
+        """投递指标（延迟为事件入队到投递成功的时间，含重试等待）"""
+        lags = sorted(self._lags)
+
+        def percentile(p: float) -> Optional[float]:
+            return round(lags[min(len(lags) - 1, int(p * len(lags)))], 3) if lags else None
+
+        return {
+            "queued_events": sum(len(q) for q in self._queues.values()),
+            "queued_destinations": len(self._queues),
+            "delivered_events": self.delivered_events,
+            "delivered_batches": self.delivered_batches,
+            "failed_attempts": self.failed_attempts,
+            "dead_batches": self.dead_batches,
+            "outbox": self.outbox.counts(),
+            "lag_seconds": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(lags[-1], 3) if lags else None
+            }
+        }
+
+
+def build_webhook_service() -> WebhookService:
+    """根据配置构建 webhook 投递服务（未配置发件箱路径时发件箱仅在内存中）"""
+    if not settings.webhook_secret:
+        logger.warning("未配置 WEBHOOK_SECRET，携带 callback_url 的请求将被拒绝")
+    return WebhookService(
+        outbox=SQLiteOutbox(settings.webhook_outbox_path or ":memory:"),
+        secret=settings.webhook_secret,
+        batch_window=settings.webhook_batch_window,
+        max_batch=settings.webhook_max_batch,
+        max_attempts=settings.webhook_max_attempts,
+        retry_concurrency=settings.webhook_retry_concurrency,
+        allowed_hosts=settings.webhook_allowed_hosts,
+        allow_private=settings.webhook_allow_private
+    )
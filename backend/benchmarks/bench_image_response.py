@@ -0,0 +1,100 @@
+"""
+生图响应模式基准：url 模式（二次下载）vs b64_json 整体解码 vs b64_json 流式解码
+
+使用本地替身后端（httpx.MockTransport），按设定的网络往返延迟与带宽模拟传输，
+统计每种模式的内存峰值（tracemalloc）与端到端耗时。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_image_response [--image-mb 4] [--rtt 0.05] [--rounds 5]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import tempfile
+import time
+import tracemalloc
+
+import aiofiles
+import httpx
+import orjson
+
+from app.services.image_providers import ImageProvider
+from app.services.image_storage import ImageStorage
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def build_transport(image: bytes, rtt: float, bandwidth: float) -> httpx.MockTransport:
+    """本地替身后端：POST 返回 url 或 b64_json，GET 返回图片字节"""
+    b64_body = orjson.dumps({"data": [{"b64_json": base64.b64encode(image).decode()}], "seed": 1})
+    url_body = orjson.dumps({"data": [{"url": "http://stand-in/images/1.png"}], "seed": 1})
+
+    async def stream(body: bytes):
+        for i in range(0, len(body), CHUNK_SIZE):
+            chunk = body[i:i + CHUNK_SIZE]
+            await asyncio.sleep(len(chunk) / bandwidth)
+            yield chunk
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(rtt)
+        if request.method == "GET":
+            return httpx.Response(200, content=stream(image))
+        payload = orjson.loads(request.content)
+        body = b64_body if payload["response_format"] == "b64_json" else url_body
+        return httpx.Response(200, content=stream(body))
+
+    return httpx.MockTransport(handler)
+
+
+async def url_mode(provider: ImageProvider, storage: ImageStorage) -> None:
+    result = await provider.generate({"prompt": "p", "response_format": "url"})
+    response = await provider.client.get(result["data"][0]["url"])
+    async with aiofiles.open(storage.path_for("url.png"), "wb") as f:
+        await f.write(response.content)
+
+
+async def b64_buffered_mode(provider: ImageProvider, storage: ImageStorage) -> None:
+    result = await provider.generate({"prompt": "p", "response_format": "b64_json"})
+    async with aiofiles.open(storage.path_for("buffered.png"), "wb") as f:
+        await f.write(base64.b64decode(result["data"][0]["b64_json"]))
+
+
+async def b64_stream_mode(provider: ImageProvider, storage: ImageStorage) -> None:
+    await provider.generate({"prompt": "p", "response_format": "b64_json"}, storage)
+
+
+async def run(args) -> None:
+    image = b"\x89PNG" + os.urandom(int(args.image_mb * 2 ** 20))
+    bandwidth = args.bandwidth_mbps * 2 ** 20 / 8
+    with tempfile.TemporaryDirectory() as directory:
+        storage = ImageStorage(directory, "/static/images")
+        print(f"image {args.image_mb} MiB, rtt {args.rtt * 1000:.0f} ms, "
+              f"bandwidth {args.bandwidth_mbps} Mbit/s, {args.rounds} rounds")
+        print(f"{'mode':<16}{'peak MiB':>10}{'mean s':>10}")
+        for name, mode in (("url", url_mode), ("b64 buffered", b64_buffered_mode), ("b64 stream", b64_stream_mode)):
+            provider = ImageProvider(
+                "stand-in", "http://stand-in", "key", "model",
+                transport=build_transport(image, args.rtt, bandwidth)
+            )
+            peaks, durations = [], []
+            for _ in range(args.rounds):
+                tracemalloc.start()
+                start = time.perf_counter()
+                await mode(provider, storage)
+                durations.append(time.perf_counter() - start)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            await provider.aclose()
+            print(f"{name:<16}{max(peaks) / 2 ** 20:>10.1f}{sum(durations) / len(durations):>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image-mb", type=float, default=4)
+    parser.add_argument("--rtt", type=float, default=0.05, help="每次请求的往返延迟（秒）")
+    parser.add_argument("--bandwidth-mbps", type=float, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
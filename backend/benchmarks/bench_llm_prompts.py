@@ -0,0 +1,156 @@
+"""
+系统提示词精简前后对比基准
+
+离线模式估算 token 数；--live 模式实际调用 DeepSeek（需配置 DEEPSEEK_API_KEY），
+对比 prompt token、输出 token 与端到端延迟。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_llm_prompts
+    python -m benchmarks.bench_llm_prompts --live --rounds 10
+"""
+
+import argparse
+import asyncio
+import math
+import re
+import statistics
+import time
+
+import httpx
+
+from app.services.llm_service import LLMService
+from app.templates.prompts import (
+    PROMPT_OPTIMIZER_SYSTEM,
+    PROMPT_OPTIMIZER_USER,
+    REFINE_SYSTEM,
+    REFINE_USER
+)
+
+
+llm_service = LLMService()
+
+
+# 精简前的系统提示词（保留用于对比）
+LEGACY_PROMPT_OPTIMIZER_SYSTEM = """你是专业可爱风插图提示词工程师，需根据用户需求生成精准的图像生成提示词。
+
+## 核心要求：
+1. **风格匹配**：紧扣用户选择的风格标签，还原核心特征
+   - Q版 = 3-5头身比例 + 大头 + 夸张表情 + 简洁线条
+   - 毛绒 = 蓬松触感 + 棉花质感 + 马卡龙色 + 针脚缝线纹理
+   - 吉卜力 = 柔和水彩 + 自然光影 + 温暖色调 + 手绘质感
+   - 潮玩盲盒 = PVC哑光 + 立体感 + 饱和色彩 + 精致细节
+   - 水彩 = 柔和边缘 + 渐变过渡 + 透明质感 + 水痕效果
+
+2. **细节补充**：自动添加以下维度描述
+   - 光影：暖光聚焦、柔光滤镜、自然散射光等
+   - 构图：中景、特写、俯视、仰视等
+   - 质感：PVC哑光、水彩晕染、毛绒蓬松等
+   - 氛围：温馨、梦幻、活泼、治愈等
+
+3. **避免冗余**：不堆砌形容词，优先按"主体+动作+场景+质感+光影"结构组织
+
+4. **语言规范**：使用英文输出提示词（适配生图模型），逻辑连贯，用逗号分隔
+
+## 输出格式：
+直接输出优化后的英文提示词，不要有任何解释或前缀。提示词应该是一段完整的描述，用逗号分隔各个元素。"""
+
+
+LEGACY_REFINE_SYSTEM = """你是专业可爱风插图提示词工程师，需要基于原提示词和用户的微调需求，生成修改后的提示词。
+
+## 微调规则：
+1. **保留核心**：保留原主题与核心场景，仅调整用户指定的维度
+2. **精准修改**：
+   - "更胖一点" → 增加圆润、饱满相关描述
+   - "换成毛绒质感" → 添加"fluffy, plush, cotton texture, stitch details"
+   - "更亮一点" → 调整光影描述为更明亮的光源
+   - "换个颜色" → 修改色彩相关描述
+3. **补充适配**：根据修改自动补充相关细节
+
+## 输出格式：
+直接输出修改后的完整英文提示词，不要有任何解释。"""
+
+
+SAMPLE_OPTIMIZE_USER = PROMPT_OPTIMIZER_USER.format(
+    theme="一只猫咪戴着蝴蝶结",
+    styles=llm_service._format_styles(["q_version", "fluffy"]),
+    size=llm_service._format_size("square_medium"),
+    purpose="social_media",
+    extra_description="在草地上玩耍，阳光明媚"
+)
+
+SAMPLE_REFINE_USER = REFINE_USER.format(
+    original_prompt="chibi cat wearing a pink bow, fluffy plush texture, macaron colors, "
+                    "playing on the grass, warm sunlight, soft focus",
+    refine_instruction="更胖一点，换成毛绒质感"
+)
+
+VARIANTS = [
+    ("optimize", "legacy", LEGACY_PROMPT_OPTIMIZER_SYSTEM, SAMPLE_OPTIMIZE_USER),
+    ("optimize", "trimmed", PROMPT_OPTIMIZER_SYSTEM, SAMPLE_OPTIMIZE_USER),
+    ("refine", "legacy", LEGACY_REFINE_SYSTEM, SAMPLE_REFINE_USER),
+    ("refine", "trimmed", REFINE_SYSTEM, SAMPLE_REFINE_USER),
+]
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（中文约 0.6 token/字，其他字符约 0.3 token/字符）"""
+    cjk = len(_CJK.findall(text))
+    return round(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+def run_offline() -> None:
+    print(f"{'endpoint':<10}{'variant':<10}{'system chars':>14}{'est. prompt tokens':>20}")
+    for endpoint, variant, system_prompt, user_prompt in VARIANTS:
+        print(f"{endpoint:<10}{variant:<10}{len(system_prompt):>14}"
+              f"{estimate_tokens(system_prompt + user_prompt):>20}")
+
+
+async def run_live(rounds: int) -> None:
+    print(f"{'endpoint':<10}{'variant':<10}{'prompt tok':>12}{'output tok':>12}{'p50 s':>8}{'p90 s':>8}")
+    for endpoint, variant, system_prompt, user_prompt in VARIANTS:
+        latencies, prompt_tokens, completion_tokens = [], [], []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = await _raw_call(system_prompt, user_prompt)
+            latencies.append(time.perf_counter() - start)
+            usage = result.get("usage") or {}
+            prompt_tokens.append(usage.get("prompt_tokens", 0))
+            completion_tokens.append(usage.get("completion_tokens", 0))
+        latencies.sort()
+        print(f"{endpoint:<10}{variant:<10}{statistics.mean(prompt_tokens):>12.0f}"
+              f"{statistics.mean(completion_tokens):>12.0f}"
+              f"{statistics.median(latencies):>8.2f}{latencies[max(0, math.ceil(len(latencies) * 0.9) - 1)]:>8.2f}")
+
+
+async def _raw_call(system_prompt: str, user_prompt: str) -> dict:
+    """直接请求 API（绕过统计，保证两组条件一致）"""
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        response = await client.post(
+            f"{llm_service.base_url}/chat/completions",
+            headers={"Authorization": f"Bearer {llm_service.api_key}"},
+            json={
+                "model": llm_service.model,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                "temperature": 0.7,
+                "max_tokens": 1000
+            }
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="实际调用 DeepSeek API")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    run_offline()
+    if args.live:
+        print()
+        asyncio.run(run_live(args.rounds))
@@ -0,0 +1,115 @@
+"""
+生成记录内存占用基准：对比原字典记录与紧凑 __slots__ 记录的每条字节数
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_record_memory [--count 1000000] [--refine-ratio 0.5]
+"""
+
+import argparse
+import gc
+import random
+import tracemalloc
+from datetime import datetime
+
+from app.models.records import GenerationRecord, RequestSpec
+from app.models.schemas import GenerationRequest, SizeEnum, StyleEnum
+
+
+PRESET_THEMES = [f"预设主题{i}：一只戴着蝴蝶结的小动物" for i in range(300)]
+STYLES = list(StyleEnum)
+SIZES = list(SizeEnum)
+
+
+def _random_request(rng: random.Random) -> GenerationRequest:
+    return GenerationRequest(
+        theme=rng.choice(PRESET_THEMES),
+        styles=rng.sample(STYLES, rng.randint(1, 3)),
+        size=rng.choice(SIZES),
+        purpose="social_media",
+        style_strength=0.8
+    )
+
+
+def _prompt(index: int) -> str:
+    return (f"chibi animal wearing a bow, fluffy plush texture, macaron colors, "
+            f"warm sunlight, soft focus, variation {index}")
+
+
+def build_legacy(count: int, refine_ratio: float, requests: list) -> dict:
+    """原实现：字典记录 + 请求字典 + ISO 时间字符串"""
+    rng = random.Random(1)
+    store = {}
+    last_id = None
+    for i in range(count):
+        generation_id = f"gen_{i:012x}"
+        is_refine = last_id is not None and rng.random() < refine_ratio
+        record = {
+            "generation_id": generation_id,
+            "image_url": f"https://ark-content.example.com/images/{generation_id}.png",
+            "optimized_prompt": _prompt(i),
+            "original_request": (store[last_id]["original_request"] if is_refine
+                                 else requests[i % len(requests)].model_dump()),
+            "seed": rng.randint(0, 2 ** 31),
+            "model": "doubao-seedream-3-0-t2i-250415",
+            "created_at": datetime.utcnow().isoformat(),
+            "parent_id": last_id if is_refine else None
+        }
+        if is_refine:
+            record["refine_instruction"] = "更胖一点"
+        store[generation_id] = record
+        last_id = generation_id
+    return store
+
+
+def build_compact(count: int, refine_ratio: float, requests: list) -> dict:
+    """新实现：__slots__ 记录 + 枚举编码 + 整数时间戳 + 共享根请求"""
+    rng = random.Random(1)
+    store = {}
+    last_id = None
+    for i in range(count):
+        generation_id = f"gen_{i:012x}"
+        is_refine = last_id is not None and rng.random() < refine_ratio
+        store[generation_id] = GenerationRecord(
+            generation_id=generation_id,
+            image_url=f"https://ark-content.example.com/images/{generation_id}.png",
+            optimized_prompt=_prompt(i),
+            request=(store[last_id].request if is_refine
+                     else RequestSpec.from_request(requests[i % len(requests)])),
+            seed=rng.randint(0, 2 ** 31),
+            model="doubao-seedream-3-0-t2i-250415",
+            created_at=GenerationRecord.now(),
+            parent_id=last_id if is_refine else None,
+            refine_instruction="更胖一点" if is_refine else None
+        )
+        last_id = generation_id
+    return store
+
+
+def measure(builder, count: int, refine_ratio: float, requests: list) -> float:
+    """返回每条记录的平均字节数"""
+    gc.collect()
+    tracemalloc.start()
+    store = builder(count, refine_ratio, requests)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    gc.collect()
+    return current / count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--refine-ratio", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # 请求对象在记录之外构造，不计入内存统计
+    reqs = [_random_request(rng) for _ in range(1000)]
+
+    legacy = measure(build_legacy, args.count, args.refine_ratio, reqs)
+    compact = measure(build_compact, args.count, args.refine_ratio, reqs)
+    print(f"records: {args.count:,}  refine ratio: {args.refine_ratio}")
+    print(f"legacy dict records   {legacy:8.1f} bytes/record  ({legacy * args.count / 2 ** 20:,.0f} MiB)")
+    print(f"compact slot records  {compact:8.1f} bytes/record  ({compact * args.count / 2 ** 20:,.0f} MiB)")
+    print(f"reduction             {(1 - compact / legacy) * 100:8.1f} %")
@@ -0,0 +1,158 @@
+"""
+响应序列化微基准：对比旧的 Pydantic 二次校验路径与 orjson 预编码路径
+
+两条路径都计入请求实际要做的全部工作：生成响应包括请求转换、记录构造与编码，
+历史读取包括在内存记录中查找历史链（含子版本扫描）与编码。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_serialization
+"""
+
+import json
+import timeit
+from datetime import datetime
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from app.models.records import GenerationRecord, RequestSpec
+from app.models.schemas import GenerationRequest, GenerationResponse
+from app.services.generation_service import GenerationService
+
+
+ITERATIONS = 20000
+HISTORY_LENGTH = 10
+# 内存中的其他记录数（历史读取需要扫描全部记录查找子版本）
+MEMORY_RECORDS = 1000
+
+
+def _build_request() -> GenerationRequest:
+    return GenerationRequest(
+        theme="一只猫咪戴着蝴蝶结",
+        styles=["q_version", "fluffy"],
+        size="square_medium",
+        purpose="social_media",
+        extra_description="在草地上玩耍，阳光明媚",
+        style_strength=0.8
+    )
+
+
+def _build_record(request_dict: dict, index: int, parent_id=None) -> dict:
+    return {
+        "generation_id": f"gen_{index:012x}",
+        "image_url": f"https://example.com/images/{index}.png",
+        "optimized_prompt": "chibi cat wearing a bow, fluffy plush texture, macaron colors, "
+                            "playing on the grass, warm sunlight, soft focus, high detail",
+        "original_request": request_dict,
+        "seed": 123456,
+        "model": "doubao-seedream-3-0-t2i-250415",
+        "created_at": datetime.utcnow().replace(microsecond=0).isoformat(),
+        "parent_id": parent_id
+    }
+
+
+def _run(coro):
+    """驱动不含真实 IO 等待的协程（避免把事件循环调度开销计入基准）"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("协程发生了等待")
+
+
+def bench_generate_response(request: GenerationRequest) -> None:
+    """单次 /generate 响应（含保存记录）"""
+    template = _build_record({}, 0)
+    legacy_store, fast_store = {}, {}
+
+    def legacy():
+        # 旧路径：保存字典记录 -> 构造响应模型 -> FastAPI 转 dict 后按 response_model 再校验 -> 通用编码器
+        legacy_store[template["generation_id"]] = {**template, "original_request": request.model_dump()}
+        response = GenerationResponse(
+            generation_id=template["generation_id"],
+            image_url=template["image_url"],
+            optimized_prompt=template["optimized_prompt"],
+            original_request=request
+        )
+        content = response.model_dump()
+        GenerationResponse.model_validate(content)
+        json.dumps(jsonable_encoder(content), ensure_ascii=False).encode("utf-8")
+
+    def fast():
+        # 新路径：请求只转换一次，构造紧凑记录并预编码，响应直接 orjson 编码
+        original_request = request.model_dump(mode="json", exclude={"callback_url"})
+        record = GenerationRecord(
+            generation_id=template["generation_id"],
+            image_url=template["image_url"],
+            optimized_prompt=template["optimized_prompt"],
+            request=RequestSpec.from_dict(original_request),
+            seed=template["seed"],
+            model=template["model"],
+            created_at=GenerationRecord.now()
+        )
+        fast_store[record.generation_id] = orjson.dumps(record.to_dict())
+        orjson.dumps({
+            "generation_id": record.generation_id,
+            "image_url": record.image_url,
+            "optimized_prompt": record.optimized_prompt,
+            "original_request": original_request,
+            "seed": record.seed,
+            "draft": False,
+            "eta_seconds": 12.5
+        })
+
+    _report("generate response", legacy, fast)
+
+
+def bench_history_read(request: GenerationRequest) -> None:
+    """/generation/{id}/history 读取（根记录 + 若干微调版本，另有其他记录在内存中）"""
+    request_dict = request.model_dump(mode="json")
+    root_id = _build_record(request_dict, 0)["generation_id"]
+    records = [_build_record(request_dict, 0)] + [
+        _build_record(request_dict, i, parent_id=root_id) for i in range(1, HISTORY_LENGTH)
+    ] + [
+        _build_record(request_dict, i) for i in range(HISTORY_LENGTH, HISTORY_LENGTH + MEMORY_RECORDS)
+    ]
+
+    # 旧路径：字典记录，逐次查找并用通用编码器序列化
+    legacy_store = {r["generation_id"]: {**r, "original_request": request.model_dump()} for r in records}
+
+    def legacy():
+        history = []
+        current_id = root_id
+        while current_id:
+            record = legacy_store.get(current_id)
+            if not record:
+                break
+            history.insert(0, record)
+            current_id = record["parent_id"]
+        history.extend(r for r in legacy_store.values() if r["parent_id"] == root_id)
+        json.dumps(jsonable_encoder({"history": history}), ensure_ascii=False).encode("utf-8")
+
+    # 新路径：实际的服务方法（内存紧凑记录 + 预编码缓存）
+    service = GenerationService(
+        llm=None, images=None, storage=None, search=None, warmup=None, webhooks=None,
+        encoded_cache_size=len(records)
+    )
+    for data in records:
+        record = GenerationRecord.from_dict(data)
+        service._generations[record.generation_id] = record
+        service._encode(record)
+
+    def fast():
+        _run(service.get_generation_history_json(root_id))
+
+    _report(f"history read ({HISTORY_LENGTH} of {len(records)} records)", legacy, fast)
+
+
+def _report(name: str, legacy, fast) -> None:
+    legacy_time = timeit.timeit(legacy, number=ITERATIONS) / ITERATIONS * 1e6
+    fast_time = timeit.timeit(fast, number=ITERATIONS) / ITERATIONS * 1e6
+    print(f"{name:<32} legacy {legacy_time:8.2f} us   fast {fast_time:8.2f} us   "
+          f"speedup x{legacy_time / fast_time:.1f}")
+
+
+if __name__ == "__main__":
+    req = _build_request()
+    bench_generate_response(req)
+    bench_history_read(req)
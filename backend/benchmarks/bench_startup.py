@@ -0,0 +1,112 @@
+"""
+启动基准：导入耗时、首个请求耗时与就绪耗时
+
+每轮在全新子进程中测量，避免模块缓存影响：
+- 导入耗时：python -c "import main" 的耗时减去空解释器启动耗时
+- 首个请求：启动 uvicorn 到 /health 首次返回 200 的时间
+- 就绪：启动 uvicorn 到 /ready 返回 200（索引已加载、连接池与工作进程已预热）的时间
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_startup [--rounds 5] [--timeout 60]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_command(args: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def measure_import() -> float:
+    """import main 的耗时（扣除解释器自身启动）"""
+    baseline = time_command([sys.executable, "-c", "pass"])
+    return time_command([sys.executable, "-c", "import main"]) - baseline
+
+
+def measure_server(timeout: float) -> tuple:
+    """
+    启动 uvicorn，轮询 /health 与 /ready
+
+    Returns:
+        (首个请求耗时, 就绪耗时)，超时的项为 None
+    """
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    first_request: Optional[float] = None
+    ready: Optional[float] = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - start < timeout:
+                path = "/health" if first_request is None else "/ready"
+                try:
+                    status = client.get(path).status_code
+                except httpx.TransportError:
+                    status = None
+                if status == 200:
+                    if first_request is None:
+                        first_request = time.perf_counter() - start
+                        continue
+                    ready = time.perf_counter() - start
+                    break
+                time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+    return first_request, ready
+
+
+def summary(name: str, values: List[Optional[float]]) -> str:
+    measured = [v for v in values if v is not None]
+    if not measured:
+        return f"{name}: 超时"
+    text = (
+        f"{name}: 中位数 {statistics.median(measured) * 1000:.0f}ms，"
+        f"最小 {min(measured) * 1000:.0f}ms，最大 {max(measured) * 1000:.0f}ms"
+    )
+    if len(measured) < len(values):
+        text += f"（{len(values) - len(measured)} 轮超时）"
+    return text
+
+
+def main(rounds: int, timeout: float) -> None:
+    imports, first_requests, readies = [], [], []
+    for _ in range(rounds):
+        imports.append(measure_import())
+        first_request, ready = measure_server(timeout)
+        first_requests.append(first_request)
+        readies.append(ready)
+
+    print(f"轮数: {rounds}，工作进程: {os.environ.get('WORKER_PROCESSES', '默认')}")
+    print(summary("导入 main", imports))
+    print(summary("首个请求（/health）", first_requests))
+    print(summary("就绪（/ready）", readies))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="单轮等待就绪的最长时间（秒）")
+    args = parser.parse_args()
+    main(args.rounds, args.timeout)
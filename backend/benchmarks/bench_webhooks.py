@@ -0,0 +1,119 @@
+"""
+Webhook 投递基准：本地接收端 + 突发事件，统计合并批次数、重试与投递延迟
+
+在本进程内用 uvicorn 启动一个本地接收端（校验签名，可按比例返回 503 模拟故障），
+向若干回调地址突发写入事件，等待全部送达后输出请求数、批次大小与延迟分位数。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_webhooks [--events 2000] [--destinations 20] [--fail-rate 0.2]
+"""
+
+import argparse
+import asyncio
+import random
+import socket
+import tempfile
+import time
+
+import orjson
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app.services.webhook_service import SQLiteOutbox, WebhookService, sign_payload
+
+
+SECRET = "bench-secret"
+
+
+class Receiver:
+    """本地接收端：校验签名并按 fail_rate 随机返回 503"""
+
+    def __init__(self, fail_rate: float):
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self.rejected = 0
+        self.bad_signatures = 0
+        self.event_ids = set()
+
+    async def handle(self, request: Request) -> Response:
+        body = await request.body()
+        self.requests += 1
+        expected = sign_payload(SECRET, request.headers["x-webhook-timestamp"], body)
+        if request.headers.get("x-webhook-signature") != expected:
+            self.bad_signatures += 1
+            return Response(status_code=401)
+        if random.random() < self.fail_rate:
+            self.rejected += 1
+            return Response(status_code=503)
+        for event in orjson.loads(body)["events"]:
+            self.event_ids.add(event["id"])
+        return Response(status_code=204)
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/hooks/{partner}", self.handle, methods=["POST"])])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def main(events: int, destinations: int, fail_rate: float, burst: int) -> None:
+    receiver = Receiver(fail_rate)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(receiver.app(), port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = WebhookService(
+            outbox=SQLiteOutbox(f"{tmp}/outbox.db"),
+            secret=SECRET,
+            batch_window=0.2,
+            base_backoff=0.2,
+            max_backoff=2.0,
+            retry_interval=0.1,
+            allow_private=True
+        )
+        service.start()
+        urls = [f"http://127.0.0.1:{port}/hooks/p{i}" for i in range(destinations)]
+
+        start = time.perf_counter()
+        sent = set()
+        for i in range(events):
+            sent.add(service.enqueue(random.choice(urls), "generation.completed", {"generation_id": f"gen_{i}"}))
+            if i % burst == burst - 1:
+                await asyncio.sleep(0.05)
+
+        while not sent <= receiver.event_ids:
+            if time.perf_counter() - start > 120:
+                print("超时：仍有事件未送达")
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        stats = service.stats()
+        await service.stop()
+
+    server.should_exit = True
+    await server_task
+
+    print(f"事件数: {events}，回调地址: {destinations}，故障率: {fail_rate:.0%}")
+    print(f"送达: {len(sent & receiver.event_ids)}/{events}，总耗时 {elapsed:.2f}s")
+    print(f"HTTP 请求: {receiver.requests}（503: {receiver.rejected}，签名错误: {receiver.bad_signatures}）")
+    print(f"成功批次: {stats['delivered_batches']}，平均每批 {stats['delivered_events'] / max(1, stats['delivered_batches']):.1f} 个事件")
+    print(f"投递延迟: p50 {stats['lag_seconds']['p50']}s，p95 {stats['lag_seconds']['p95']}s，max {stats['lag_seconds']['max']}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--destinations", type=int, default=20)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    parser.add_argument("--burst", type=int, default=100, help="每批突发事件数")
+    args = parser.parse_args()
+    asyncio.run(main(args.events, args.destinations, args.fail_rate, args.burst))
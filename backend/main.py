@@ -2,11 +2,30 @@
 可爱插图生成智能体 - FastAPI 主入口
 """
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 
 from app.api.routes import router
 from app.core.config import settings
+from app.core.responses import ORJSONResponse
+from app.core.tracing import tracer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：创建并启动服务；关闭时刷盘未持久化的记录并释放连接池"""
+    # 服务在此处创建而非导入时：导入 main 不触发服务初始化与索引加载
+    from app.services.container import ServiceContainer
+
+    services = ServiceContainer()
+    app.state.services = services
+    await services.start()
+    yield
+    await services.aclose()
+
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -30,7 +49,9 @@ app = FastAPI(
     """,
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # 配置 CORS
@@ -42,9 +63,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+
+# 请求追踪：每个请求一个 trace，trace id 通过 X-Trace-Id 头传入/返回
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace, token = tracer.start_trace(
+        f"{request.method} {request.url.path}",
+        trace_id=request.headers.get("x-trace-id")
+    )
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Trace-Id"] = trace.trace_id
+        return response
+    finally:
+        tracer.finish_trace(trace, token, status)
+
+
 # 注册路由
 app.include_router(router, prefix="/api/v1", tags=["illustration"])
 
+# 本地保存的图片（b64_json 模式）
+app.mount(
+    settings.image_public_path,
+    StaticFiles(directory=settings.image_storage_dir, check_dir=False),
+    name="images"
+)
+
+if settings.enable_debug_endpoints:
+    from app.api.debug import router as debug_router
+    app.include_router(debug_router, prefix="/debug", tags=["debug"])
+
 
 @app.get("/", tags=["health"])
 async def root():
@@ -62,6 +113,16 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready", tags=["health"])
+async def readiness_check(request: Request):
+    """就绪检查：索引已加载、上游连接池与工作进程已预热后返回 200，否则 503"""
+    services = getattr(request.app.state, "services", None)
+    if services is None:
+        return ORJSONResponse({"ready": False, "checks": {}, "seconds_to_ready": None}, status_code=503)
+    status = services.readiness()
+    return ORJSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -4,7 +4,11 @@
 
 # 检查 Python 环境
 if ! command -v python3 &> /dev/null; then
-    echo "错误: 未找到 Python3，请先安装 Python 3.9+"
+    echo "错误: 未找到 Python3，请先安装 Python 3.10+"
+    exit 1
+fi
+if ! python3 -c 'import sys; sys.exit(sys.version_info < (3, 10))'; then
+    echo "错误: 需要 Python 3.10+，当前为 $(python3 -V 2>&1)"
     exit 1
 fi
 